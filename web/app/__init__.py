@@ -14,7 +14,9 @@ from raven.contrib.flask import Sentry
 from werkzeug.contrib.fixers import ProxyFix
 
 from config import config
+from .cache import cache, init_plot_cache
 from .database import db
+from .encoder import init_json
 
 bootstrap = Bootstrap()
 security = Security()
@@ -41,6 +43,9 @@ def create_app(config_name):
     bootstrap.init_app(app)
 
     db.init_app(app)
+    cache.init_app(app)
+    init_plot_cache(app)
+    init_json(app)
     security.init_app(app, user_datastore)
     toolbar.init_app(app)
 
@@ -9,6 +9,7 @@ from flask_security import roles_required, current_user
 import logging
 import os.path as op
 
+from ..cache import gage_keys, invalidate_geojson
 from ..database import db
 from ..models import User, Region, River, Section, Gage, Sensor, Correlation
 
@@ -79,10 +80,28 @@ class GageView(ModelView):
     # inline_models = (Sensor,)
     form_widget_args = {'point': h_w}
 
+    def after_model_change(self, form, model, is_created):
+        """
+        Drop any cached signing key and summary so that a new key or name
+        takes effect, and the cached map so that it shows the change.
+        """
+        gage_keys.delete(model.id)
+        invalidate_geojson()
+
+    def after_model_delete(self, model):
+        gage_keys.delete(model.id)
+        invalidate_geojson()
+
 
 class SensorView(ModelView):
     form_excluded_columns = ['samples']
 
+    def after_model_change(self, form, model, is_created):
+        invalidate_geojson()
+
+    def after_model_delete(self, model):
+        invalidate_geojson()
+
 
 class MyAdminIndexView(AdminIndexView):
 
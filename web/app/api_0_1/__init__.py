@@ -12,21 +12,32 @@ Endpoints:
 - **/api/1.0/sensors/ - **GET** List all sensors
 - **/api/1.0/sensors/<id> - **GET** Detailed information about sensor
 - **/api/1.0/sensors/<id>/samples - **GET** Samples from sensor *id*
+- **/api/1.0/sensors/<id>/aggregate - **GET** Samples from sensor *id* aggregated over time buckets
+- **/api/1.0/sensors/<id>/samples.csv - **GET** Samples from sensor *id* streamed as CSV
+- **/api/1.0/sensors/<id>/samples.ndjson - **GET** Samples from sensor *id* streamed as newline delimited JSON
+- **/api/1.0/sensors/<id>/samples.arrow - **GET** Samples from sensor *id* as an Arrow IPC file
+- **/api/1.0/sensors/<id>/samples.parquet - **GET** Samples from sensor *id* as Parquet
 - **/api/1.0/samples/ - **GET** List all samples
 - **/api/1.0/samples/<id> - **GET** Detailed information about sample *id*
+- **/api/1.0/samples.arrow?sensors=<id>,<id> - **GET** Samples from several sensors as an Arrow IPC file
+- **/api/1.0/samples.parquet?sensors=<id>,<id> - **GET** Samples from several sensors as Parquet
 - **/api/1.0/regions/** - **GET** List all regions
 - **/api/1.0/regions/<id>** - **GET** Detailed information about region *id*
 - **/api/1.0/rivers/ - **GET** List all rivers
 - **/api/1.0/rivers/<id>** - **GET** Detained information about river *id*
 - **/api/1.0/sections/** - **GET** List all sections
 - **/api/1.0/sections/<id>** - **GET** Detailed information about section *id*
+
+List endpoints accept ``?fields=id,name`` to limit the fields returned for
+each object, which also skips their ``url`` and ``html`` links.
 """
-from flask import jsonify, url_for
+from flask import url_for
 
+from ..encoder import jsonify
 from .blueprint import api
 
 # Import other API views
-from . import gages, sensors, samples, rivers, sections, regions  # noqa
+from . import gages, sensors, samples, rivers, sections, regions, exports  # noqa
 
 
 @api.route('/')
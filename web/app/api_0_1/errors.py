@@ -1,7 +1,7 @@
 """
 Errors that can be referenced by other api routes
 """
-from flask import jsonify
+from app.encoder import jsonify
 from app.exceptions import ValidationError
 from .blueprint import api
 
@@ -24,6 +24,12 @@ def forbidden(message):
     return response
 
 
+def not_implemented(message):
+    response = jsonify({'error': 'not implemented', 'message': message})
+    response.status_code = 501
+    return response
+
+
 @api.errorhandler(404)
 def not_found(message):
     response = jsonify({'error': 'not found', 'message': message})
@@ -0,0 +1,268 @@
+"""
+Bulk exports of the full history of a sensor, streamed from a server side
+cursor so memory use stays constant however many samples there are. The
+Arrow and Parquet files are streamed as each batch is written as well.
+
+Endpoints:
+----------
+
+- **/api/1.0/sensors/<id>/samples.csv - **GET** Samples from sensor *id* as CSV
+- **/api/1.0/sensors/<id>/samples.ndjson - **GET** Samples from sensor *id* as newline delimited JSON
+- **/api/1.0/sensors/<id>/samples.arrow - **GET** Samples from sensor *id* as an Arrow IPC file
+- **/api/1.0/sensors/<id>/samples.parquet - **GET** Samples from sensor *id* as Parquet
+- **/api/1.0/samples.arrow?sensors=<id>,<id> - **GET** Samples from several sensors as an Arrow IPC file
+- **/api/1.0/samples.parquet?sensors=<id>,<id> - **GET** Samples from several sensors as Parquet
+
+The Arrow and Parquet exports need pyarrow, and return 501 without it.
+
+Datetimes are exported as they are stored, without a time zone. Samples
+are meant to be stored in UTC, but not every remote source normalizes
+them, so some are in their station's local time.
+"""
+import csv
+import io
+from itertools import islice
+import json
+
+from flask import Response, request, stream_with_context
+
+from ..database import db
+from ..exceptions import ValidationError
+from ..models import Sensor, Sample
+from ..timerange import startend, filter_range
+from .blueprint import api
+from .errors import not_implemented
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+EXPORT_BATCH = 5000
+# ISO 8601 without a zone, as samples aren't all stored in UTC
+EXPORT_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+COLUMNAR_MIMETYPES = {'arrow': 'application/vnd.apache.arrow.file',
+                      'parquet': 'application/vnd.apache.parquet'}
+
+
+def sample_rows(sid):
+    """
+    Return a query for the (id, datetime, value) of samples from sensor sid
+    within the start and end arguments, oldest first, which fetches rows in
+    batches of EXPORT_BATCH.
+    """
+    start, end = startend()
+    query = db.session.query(Sample.id, Sample.datetime, Sample.value)\
+                      .filter(Sample.sensor_id == sid,
+                              Sample.datetime.isnot(None))
+    query = filter_range(query, Sample.datetime, start, end)
+    return query.order_by(Sample.datetime, Sample.id).yield_per(EXPORT_BATCH)
+
+
+def export_response(chunks, mimetype, filename):
+    """
+    Stream the chunks generator as an attachment named filename
+    """
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = \
+        'attachment; filename={0}'.format(filename)
+    return response
+
+
+@api.route('/sensors/<int:sid>/samples.csv')
+def get_sensor_samples_csv(sid):
+    """
+    Samples from sensor *id* as CSV with ``id,datetime,value`` columns,
+    with datetimes in ISO 8601 without a time zone, as they are stored
+
+    Parameters:
+        id (int): Primary id key of sensor
+        start (str): Optional YYYYMMDD date of the first sample
+        end (str): Optional YYYYMMDD date to stop before
+    """
+    Sensor.query.get_or_404(sid)
+    rows = sample_rows(sid)
+
+    def generate():
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(('id', 'datetime', 'value'))
+        for n, (sample_id, dt, value) in enumerate(rows, 1):
+            writer.writerow((sample_id, dt.strftime(EXPORT_DATETIME_FORMAT), value))
+            if n % EXPORT_BATCH == 0:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue()
+
+    return export_response(generate(), 'text/csv',
+                           'sensor-{0}.csv'.format(sid))
+
+
+@api.route('/sensors/<int:sid>/samples.ndjson')
+def get_sensor_samples_ndjson(sid):
+    """
+    Samples from sensor *id* as newline delimited JSON, with one
+    ``{"id": ..., "datetime": ..., "value": ...}`` object per line and
+    datetimes in ISO 8601 without a time zone, as they are stored
+
+    Parameters:
+        id (int): Primary id key of sensor
+        start (str): Optional YYYYMMDD date of the first sample
+        end (str): Optional YYYYMMDD date to stop before
+    """
+    Sensor.query.get_or_404(sid)
+    rows = sample_rows(sid)
+
+    def generate():
+        lines = []
+        for sample_id, dt, value in rows:
+            lines.append(json.dumps({
+                'id': sample_id,
+                'datetime': dt.strftime(EXPORT_DATETIME_FORMAT),
+                'value': value
+            }))
+            if len(lines) == EXPORT_BATCH:
+                yield '\n'.join(lines) + '\n'
+                lines = []
+        if lines:
+            yield '\n'.join(lines) + '\n'
+
+    return export_response(generate(), 'application/x-ndjson',
+                           'sensor-{0}.ndjson'.format(sid))
+
+
+class ChunkSink(object):
+    """
+    Write only file object that holds what is written until it is taken,
+    so that an Arrow or Parquet file can be streamed as it is written.
+    """
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        """
+        Return and forget everything written since the last take
+        """
+        data = b''.join(self.chunks)
+        del self.chunks[:]
+        return data
+
+
+def columnar_export(sensor_ids, fmt, start=None, end=None):
+    """
+    Generate the bytes of an Arrow IPC file or Parquet file with
+    ``sensor_id`` (int32), ``datetime`` (timestamp[us]) and ``value``
+    (float64) columns for the samples from sensor_ids from start until end.
+
+    Columns are fetched straight from the database cursor in batches of
+    EXPORT_BATCH, and each batch is converted to an Arrow record batch (or
+    a Parquet row group) and sent before the next is fetched, so memory use
+    stays constant however many samples there are.
+    """
+    query = db.session.query(Sample.sensor_id, Sample.datetime, Sample.value)\
+                      .filter(Sample.sensor_id.in_(sensor_ids),
+                              Sample.datetime.isnot(None))
+    query = filter_range(query, Sample.datetime, start, end)
+    rows = iter(query.order_by(Sample.sensor_id, Sample.datetime, Sample.id)
+                     .yield_per(EXPORT_BATCH))
+
+    schema = pa.schema([pa.field('sensor_id', pa.int32()),
+                        pa.field('datetime', pa.timestamp('us')),
+                        pa.field('value', pa.float64())])
+    sink = ChunkSink()
+    stream = pa.PythonFile(sink, mode='w')
+    if fmt == 'arrow':
+        writer = pa.RecordBatchFileWriter(stream, schema)
+    else:
+        writer = pq.ParquetWriter(stream, schema)
+    try:
+        while True:
+            batch = list(islice(rows, EXPORT_BATCH))
+            if not batch:
+                break
+            sids, datetimes, values = zip(*batch)
+            record_batch = pa.RecordBatch.from_arrays(
+                [pa.array(sids, type=pa.int32()),
+                 pa.array(datetimes, type=pa.timestamp('us')),
+                 pa.array(values, type=pa.float64())],
+                schema.names)
+            if fmt == 'arrow':
+                writer.write_batch(record_batch)
+            else:
+                writer.write_table(pa.Table.from_batches([record_batch]))
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+def columnar_response(sensor_ids, fmt, filename):
+    """
+    Respond with an Arrow or Parquet export of sensor_ids, or 501 if pyarrow
+    isn't installed
+    """
+    if pa is None:
+        return not_implemented('{0} export requires pyarrow'.format(fmt))
+    # parsed before streaming so that bad arguments are still a 400
+    start, end = startend()
+    chunks = columnar_export(sensor_ids, fmt, start, end)
+    response = Response(stream_with_context(chunks),
+                        mimetype=COLUMNAR_MIMETYPES[fmt])
+    response.headers['Content-Disposition'] = \
+        'attachment; filename={0}.{1}'.format(filename, fmt)
+    return response
+
+
+@api.route('/sensors/<int:sid>/samples.<any(arrow, parquet):fmt>')
+def get_sensor_samples_columnar(sid, fmt):
+    """
+    Samples from sensor *id* as an Arrow IPC file or Parquet file, with
+    datetimes as timestamps without a time zone, as they are stored
+
+    Parameters:
+        id (int): Primary id key of sensor
+        start (str): Optional YYYYMMDD date of the first sample
+        end (str): Optional YYYYMMDD date to stop before
+    """
+    Sensor.query.get_or_404(sid)
+    return columnar_response([sid], fmt, 'sensor-{0}'.format(sid))
+
+
+@api.route('/samples.<any(arrow, parquet):fmt>')
+def get_samples_columnar(fmt):
+    """
+    Samples from several sensors as an Arrow IPC file or Parquet file,
+    ordered by sensor and then datetime, with datetimes as timestamps
+    without a time zone, as they are stored
+
+    Parameters:
+        sensors (str): Comma separated sensor ids such as ``1,2,5``
+        start (str): Optional YYYYMMDD date of the first sample
+        end (str): Optional YYYYMMDD date to stop before
+    """
+    try:
+        sensor_ids = sorted(set(int(sid) for sid in
+                                request.args.get('sensors', '').split(',')))
+    except ValueError:
+        raise ValidationError('sensors should be comma separated sensor ids')
+    return columnar_response(sensor_ids, fmt, 'samples')
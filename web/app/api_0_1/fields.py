@@ -0,0 +1,19 @@
+"""
+The ?fields=id,name argument that limits which fields list endpoints return
+for each object. The fields are passed to the models' ``to_json`` so that
+leaving out ``url`` and ``html`` skips building links, and leaving out
+related objects skips loading them.
+"""
+from flask import request
+
+
+def requested_fields():
+    """
+    Return the set of field names from the fields argument, or None if all
+    fields should be returned
+    """
+    fields = request.args.get('fields')
+    if not fields:
+        return None
+    return set(field.strip() for field in fields.split(',') if field.strip())
+
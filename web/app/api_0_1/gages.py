@@ -10,12 +10,63 @@ Endpoints:
 
 """
 
-from flask import jsonify, request, url_for, current_app
+from collections import namedtuple
+
+from flask import abort, request, url_for, current_app
 from itsdangerous import JSONWebSignatureSerializer, BadSignature
 
+from ..cache import (cached_document, document_response, gage_keys,
+                     geojson_key, invalidate_geojson)
+from ..database import db
+from ..encoder import jsonify
 from ..models import Gage
 from .blueprint import api
 from .errors import unauthorized
+from .fields import requested_fields
+
+GageKey = namedtuple('GageKey', ['key', 'serializer', 'json'])
+
+
+def load_gage_key(gid):
+    """
+    Return a GageKey with the signing key and serializer for gage *gid*,
+    and the columns for its ``Gage.summary_json``, or None if the gage does
+    not exist.
+    """
+    row = db.session.query(Gage.key, Gage.name, Gage.location, Gage.slug)\
+                    .filter(Gage.id == gid).first()
+    if row is None:
+        return None
+    return GageKey(row.key, JSONWebSignatureSerializer(row.key),
+                   (gid, row.name, row.location, row.slug))
+
+
+def verify_samples(gid, data):
+    """
+    Verify and load a signed sample payload for gage *gid*.
+
+    The key and serializer come from the per-process ``gage_keys`` cache, so
+    the database is only hit when the gage isn't cached. If the signature
+    doesn't match a cached key, the key is reloaded once in case it was
+    changed by another process.
+
+    Returns a (GageKey, payload) tuple. Raises ``BadSignature`` or
+    ``TypeError`` (no key for the gage) if the payload can't be verified,
+    and aborts with a 404 for unknown gages.
+    """
+    gage_key = gage_keys.get(gid)
+    fresh = gage_key is None
+    if fresh:
+        gage_key = gage_keys.get_or_set(gid, load_gage_key)
+        if gage_key is None:
+            abort(404)
+    try:
+        return gage_key, gage_key.serializer.loads(data)
+    except (BadSignature, TypeError):
+        if fresh:
+            raise
+        gage_keys.delete(gid)
+        return verify_samples(gid, data)
 
 
 @api.route('/gages/')
@@ -53,8 +104,9 @@ def get_gages():
     next_p = None
     if pagination.has_next:
         next_p = url_for('.get_gages', page=page+1, _external=True)
+    fields = requested_fields()
     return jsonify({
-        'gages': [gage.to_json() for gage in gages],
+        'gages': [gage.to_json(fields) for gage in gages],
         'prev': prev,
         'next': next_p,
         'count': pagination.total
@@ -63,12 +115,20 @@ def get_gages():
 
 @api.route('/gages/map/')
 def get_gage_geojson():
-    gages = Gage.query.all()
-    geojson = {
-        'type': 'FeatureCollection',
-        'features': [gage.geojson() for gage in gages]
-    }
-    return jsonify(geojson)
+    """
+    Returns a GeoJSON FeatureCollection for the gages
+
+    The serialized and compressed collection is cached for each host until
+    samples arrive or a gage changes, and is served with an ETag for
+    conditional requests.
+    """
+    document = cached_document(
+        geojson_key(),
+        lambda: jsonify(Gage.geojson_collection()).get_data(),
+        timeout=current_app.config['GEOJSON_CACHE_TIMEOUT'])
+    return document_response(document,
+                             current_app.response_class,
+                             'application/json')
 
 
 @api.route('/gages/<int:gid>')
@@ -171,8 +231,9 @@ def gage_new_samples(gid):
                 return False
 
     If the key matches the stored key for the gage id in the url, \
-    the server will iterate over the samples and add them to the database \
-    creating new sensors for the gage if a new sample type is found. \
+    the server will add all of the samples to the database in a single \
+    transaction, creating new sensors for the gage if a new sample type \
+    is found. \
     Then the server will return JSON with a status code of 200.
 
     Example response: ::
@@ -205,10 +266,8 @@ def gage_new_samples(gid):
         {'error': 'unauthorized', 'message': 'bad signature'}
 
     """
-    gage = Gage.query.get_or_404(gid)
-    s = JSONWebSignatureSerializer(gage.key)
     try:
-        req_json = s.loads(request.data)
+        gage_key, req_json = verify_samples(gid, request.data)
     except BadSignature:  # If the signature doesn't match
         return unauthorized('bad signature')
     except TypeError:  # Return unauthorized if no key defined for gage
@@ -216,18 +275,13 @@ def gage_new_samples(gid):
     else:
         samples = req_json['samples']
         output = []
-        print(samples)
-        for sample in samples:
-            result = gage.new_sample(stype=sample['type'].lower(),
-                                     value=sample['value'],
-                                     sdatetime=sample['datetime'])
+        for sample, result in zip(samples, Gage.add_samples(gid, samples)):
             result_json = result.to_sensor_json()
-            print(result_json)
             result_json['sender_id'] = sample['sender_id']
-            print(result_json)
             output.append(result_json)
+        invalidate_geojson()
         return jsonify({
-            'gage': gage.to_json(),
+            'gage': Gage.summary_json(*gage_key.json),
             'samples': output,
             'result': 'created'
         })
@@ -0,0 +1,101 @@
+"""
+Keyset (cursor) pagination for samples
+
+Pages are ordered by (datetime, id) and each page is found by comparing
+against the last row of the one before it, so every page costs the same
+no matter how deep it is. The cursors that are handed out in ``next`` and
+``prev`` links are opaque tokens.
+"""
+import base64
+import datetime
+import json
+
+from sqlalchemy import tuple_
+
+from ..database import db
+from ..exceptions import ValidationError
+from ..models import Sample
+
+CURSOR_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+estimate_samples_sql = db.text("""
+SELECT reltuples::bigint
+FROM pg_class
+WHERE relname = 'samples'""")
+
+
+def encode_cursor(direction, sample):
+    """
+    Return an opaque cursor token for paging in direction ('next' or
+    'prev') from sample
+    """
+    key = [direction,
+           sample.datetime.strftime(CURSOR_DATETIME_FORMAT),
+           sample.id]
+    token = base64.urlsafe_b64encode(json.dumps(key).encode('utf-8'))
+    return token.decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Return the (direction, datetime, id) from a cursor token.
+    Raises ValidationError if the token isn't valid.
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        direction, dt, sid = json.loads(
+            base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        dt = datetime.datetime.strptime(dt, CURSOR_DATETIME_FORMAT)
+        sid = int(sid)
+    except (TypeError, ValueError, UnicodeError):
+        raise ValidationError('invalid cursor')
+    if direction not in ('next', 'prev'):
+        raise ValidationError('invalid cursor')
+    return direction, dt, sid
+
+
+def paginate_samples(query, per_page, cursor=None):
+    """
+    Return a page of ``Sample`` objects from query as
+    (samples, next cursor, prev cursor), where the cursors are None if there
+    isn't a page in that direction.
+
+    Arguments:
+        query: ``Sample`` query to page through
+        per_page (int): Number of samples on each page
+        cursor (str): Token from a previous page, or None for the first page
+    """
+    key = tuple_(Sample.datetime, Sample.id)
+    query = query.filter(Sample.datetime.isnot(None))
+    if cursor is None:
+        direction = 'next'
+    else:
+        direction, dt, sid = decode_cursor(cursor)
+    if direction == 'next':
+        if cursor is not None:
+            query = query.filter(key > tuple_(dt, sid))
+        samples = query.order_by(Sample.datetime, Sample.id)\
+                       .limit(per_page + 1).all()
+        more = len(samples) > per_page
+        samples = samples[:per_page]
+        next_c = encode_cursor('next', samples[-1]) if more else None
+        prev_c = None
+        if cursor is not None and samples:
+            prev_c = encode_cursor('prev', samples[0])
+    else:
+        samples = query.filter(key < tuple_(dt, sid))\
+                       .order_by(Sample.datetime.desc(), Sample.id.desc())\
+                       .limit(per_page + 1).all()
+        more = len(samples) > per_page
+        samples = samples[:per_page][::-1]
+        prev_c = encode_cursor('prev', samples[0]) if more else None
+        next_c = encode_cursor('next', samples[-1]) if samples else None
+    return samples, next_c, prev_c
+
+
+def estimate_samples():
+    """
+    Return the planner's estimate of the number of samples, which is kept
+    up to date by autovacuum, instead of counting the whole table
+    """
+    return db.session.execute(estimate_samples_sql).scalar()
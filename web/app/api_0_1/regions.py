@@ -6,10 +6,12 @@ Endpoints:
 - **/api/1.0/regions/<id>** - **GET** Detailed information about region *id*
 """
 
-from flask import jsonify, request, url_for, current_app
+from flask import request, url_for, current_app
 
+from ..encoder import jsonify
 from ..models import Region
 from .blueprint import api
+from .fields import requested_fields
 
 
 @api.route('/regions/')
@@ -48,8 +50,9 @@ def get_regions():
     next_p = None
     if pagination.has_next:
         next_p = url_for('.get_regions', page=page+1, _external=True)
+    fields = requested_fields()
     return jsonify({
-        'regions': [region.to_json() for region in regions],
+        'regions': [region.to_json(fields) for region in regions],
         'prev': prev,
         'next': next_p,
         'count': pagination.total
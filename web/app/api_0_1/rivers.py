@@ -7,10 +7,12 @@ Endpoints:
 - **/api/1.0/rivers/ - **GET** List all rivers
 
 """
-from flask import jsonify, request, url_for, current_app
+from flask import request, url_for, current_app
 
+from ..encoder import jsonify
 from ..models import River
 from .blueprint import api
+from .fields import requested_fields
 
 
 @api.route('/rivers/')
@@ -46,8 +48,9 @@ def get_rivers():
     next_p = None
     if pagination.has_next:
         next_p = url_for('.get_rivers', page=page+1, _external=True)
+    fields = requested_fields()
     return jsonify({
-        'rivers': [river.to_json() for river in rivers],
+        'rivers': [river.to_json(fields) for river in rivers],
         'prev': prev,
         'next': next_p,
         'count': pagination.total
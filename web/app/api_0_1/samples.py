@@ -5,10 +5,13 @@ Endpoints:
 - **/api/1.0/samples/ - **GET** List all samples
 - **/api/1.0/samples/<id> - **GET** Detailed information about sample *id*
 """
-from flask import jsonify, request, url_for, current_app
+from flask import request, url_for, current_app
 
+from ..encoder import jsonify
 from ..models import Sample
 from .blueprint import api
+from .fields import requested_fields
+from .pagination import estimate_samples, paginate_samples
 
 
 @api.route('/samples/')
@@ -16,10 +19,20 @@ def get_samples():
     """
     List all samples
 
+    Parameters:
+        cursor (str): Page to return, as given in the ``next`` or ``prev``
+                      links of another page
+        count (str): ``exact`` to count all samples, otherwise ``count``
+                     is an estimate
+        fields (str): Comma separated fields to return for each sample such
+                      as ``id,value,datetime``
+
+    Samples are ordered by datetime.
+
     Example response: ::
 
         { "count": 10696,
-          "next": "http://riverflo.ws/api/1.0/samples/?page=2",
+          "next": "http://riverflo.ws/api/1.0/samples/?cursor=WyJuZXh0Ii...",
           "prev": null,
           "samples": [
             { "datetime": "Thu, 05 Jun 2014 13:50:27 GMT",
@@ -57,22 +70,26 @@ def get_samples():
           ]
         }
     """
-    page = request.args.get('page', 1, type=int)
-    pagination = Sample.query.paginate(page,
-                                       per_page=current_app.config['API_GAGES_PER_PAGE'],  # noqa
-                                       error_out=False)
-    samples = pagination.items
+    samples, next_c, prev_c = paginate_samples(
+        Sample.query,
+        current_app.config['API_GAGES_PER_PAGE'],
+        request.args.get('cursor'))
     prev = None
-    if pagination.has_prev:
-        prev = url_for('.get_samples', page=page-1, _external=True)
+    if prev_c is not None:
+        prev = url_for('.get_samples', cursor=prev_c, _external=True)
     next_p = None
-    if pagination.has_next:
-        next_p = url_for('.get_samples', page=page+1, _external=True)
+    if next_c is not None:
+        next_p = url_for('.get_samples', cursor=next_c, _external=True)
+    if request.args.get('count') == 'exact':
+        count = Sample.query.count()
+    else:
+        count = estimate_samples()
+    fields = requested_fields()
     return jsonify({
-        'samples': [sample.to_json() for sample in samples],
+        'samples': [sample.to_json(fields) for sample in samples],
         'prev': prev,
         'next': next_p,
-        'count': pagination.total
+        'count': count
     })
 
 
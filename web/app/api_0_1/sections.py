@@ -5,10 +5,12 @@ Endpoints:
 - **/api/1.0/sections/** - **GET** List all sections
 - **/api/1.0/sections/<id>** - **GET** Detailed information about section *id*
 """
-from flask import jsonify, request, url_for, current_app
+from flask import request, url_for, current_app
 
+from ..encoder import jsonify
 from ..models import Section
 from .blueprint import api
+from .fields import requested_fields
 
 
 @api.route('/sections/')
@@ -44,8 +46,9 @@ def get_sections():
     next_p = None
     if pagination.has_next:
         next_p = url_for('.get_sections', page=page+1)
+    fields = requested_fields()
     return jsonify({
-        'sections': [section.to_json() for section in sections],
+        'sections': [section.to_json(fields) for section in sections],
         'prev': prev,
         'next': next_p,
         'count': pagination.total
@@ -5,11 +5,35 @@ Endpoints:
 - **/api/1.0/sensors/ - **GET** List all sensors
 - **/api/1.0/sensors/<id> - **GET** Detailed information about sensor
 - **/api/1.0/sensors/<id>/samples - **GET** Samples from sensor *id*
+- **/api/1.0/sensors/<id>/aggregate - **GET** Samples from sensor *id* aggregated over time buckets
 """
-from flask import jsonify, request, url_for, current_app
+import re
 
-from ..models import Sensor, Sample
+from flask import request, url_for, current_app
+from sqlalchemy import func
+
+from ..database import db
+from ..encoder import jsonify
+from ..exceptions import ValidationError
+from ..models import Sensor, Sample, SampleRollup
+from ..timerange import startend
 from .blueprint import api
+from .fields import requested_fields
+from .pagination import paginate_samples
+
+BUCKET_UNITS = {'m': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+
+def bucket_seconds(bucket):
+    """
+    Return the number of seconds in a bucket width like 15m, 1h, or 1d.
+    Raises ValidationError if the width can't be understood.
+    """
+    match = re.match(r'^(\d+)([mhd])$', bucket)
+    if match is None or int(match.group(1)) == 0:
+        raise ValidationError('bucket should be a number of minutes, hours, '
+                              'or days such as 15m, 1h, or 1d')
+    return int(match.group(1)) * BUCKET_UNITS[match.group(2)]
 
 
 @api.route('/sensors/')
@@ -45,8 +69,9 @@ def get_sensors():
     next_p = None
     if pagination.has_next:
         next_p = url_for('.get_sensors', page=page+1, _external=True)
+    fields = requested_fields()
     return jsonify({
-        'sensors': [sensor.to_json() for sensor in sensors],
+        'sensors': [sensor.to_json(fields) for sensor in sensors],
         'prev': prev,
         'next': next_p,
         'count': pagination.total
@@ -96,6 +121,14 @@ def get_sensor_samples(sid):
 
     Parameters:
         id (int): Primary id key of sensor
+        cursor (str): Page to return, as given in the ``next`` or ``prev``
+                      links of another page
+        count (str): ``exact`` to count the samples, otherwise ``count``
+                     comes from the daily rollups
+        fields (str): Comma separated fields to return for each sample such
+                      as ``id,value,datetime``
+
+    Samples are ordered by datetime.
 
     Example response: ::
 
@@ -122,22 +155,86 @@ def get_sensor_samples(sid):
         }
     """
     sensor = Sensor.query.get_or_404(sid)
-    sensor.recent()
-    page = request.args.get('page', 1, type=int)
-    pagination = Sample.query.filter_by(sensor_id=sid).paginate(page,
-                                                                per_page=current_app.config['API_GAGES_PER_PAGE'],  # noqa
-                                                                error_out=False)
-    samples = pagination.items
+    query = Sample.query.filter_by(sensor_id=sid)
+    samples, next_c, prev_c = paginate_samples(
+        query,
+        current_app.config['API_GAGES_PER_PAGE'],
+        request.args.get('cursor'))
     prev = None
-    if pagination.has_prev:
-        prev = url_for('.get_sensor_samples', page=page-1, _external=True)
+    if prev_c is not None:
+        prev = url_for('.get_sensor_samples', sid=sid, cursor=prev_c, _external=True)
     next_p = None
-    if pagination.has_next:
-        next_p = url_for('.get_sensor_samples', page=page+1, _external=True)
+    if next_c is not None:
+        next_p = url_for('.get_sensor_samples', sid=sid, cursor=next_c, _external=True)
+    if request.args.get('count') == 'exact':
+        count = query.count()
+    else:
+        count = db.session.query(func.coalesce(func.sum(SampleRollup.count), 0))\
+                          .filter(SampleRollup.sensor_id == sid,
+                                  SampleRollup.period == 'day')\
+                          .scalar()
+    fields = requested_fields()
     return jsonify({
         'sensor': sensor.to_json(),
-        'samples': [sample.to_sensor_json() for sample in samples],
+        'samples': [sample.to_sensor_json(fields) for sample in samples],
         'prev': prev,
         'next': next_p,
-        'count': pagination.total,
+        'count': count,
+    })
+
+
+@api.route('/sensors/<int:sid>/aggregate')
+def get_sensor_aggregate(sid):
+    """
+    Minimum, maximum, mean, and count of samples for sensor *id* over
+    buckets of time
+
+    Parameters:
+        id (int): Primary id key of sensor
+        bucket (str): Bucket width in minutes, hours, or days. e.g. ``15m``,
+                      ``1h`` (default), ``6h``, or ``1d``
+        start (str): Optional date to start at as YYYYMMDD
+        end (str): Optional date to end before as YYYYMMDD
+
+    Buckets that are whole hours or days are built from continuously
+    maintained hourly and daily rollups, other widths are computed from
+    the samples.
+
+    Example response: ::
+
+        { "bucket": "1h",
+          "buckets": [
+            { "count": 4,
+              "maximum": 4.33,
+              "mean": 4.3125,
+              "minimum": 4.29,
+              "start": "Mon, 03 Nov 2014 18:00:00 GMT"
+            },
+            { "count": 4,
+              "maximum": 4.36,
+              "mean": 4.34,
+              "minimum": 4.32,
+              "start": "Mon, 03 Nov 2014 19:00:00 GMT"
+            }
+          ],
+          "sensor": {
+            "id": 10,
+            "type": "usgs-height",
+            "url": "http://riverflo.ws/api/1.0/sensors/10"
+          }
+        }
+    """
+    sensor = Sensor.query.get_or_404(sid)
+    bucket = request.args.get('bucket', '1h')
+    seconds = bucket_seconds(bucket)
+    start, end = startend()
+    rows = SampleRollup.aggregate(sid, seconds, start, end)
+    return jsonify({
+        'sensor': sensor.to_json(),
+        'bucket': bucket,
+        'buckets': [{'start': row.start,
+                     'minimum': row.minimum,
+                     'maximum': row.maximum,
+                     'mean': row.mean,
+                     'count': row.count} for row in rows]
     })
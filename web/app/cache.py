@@ -0,0 +1,173 @@
+"""
+Caches for values that are expensive to rebuild on every request.
+
+``cache`` is the shared Flask-Cache backend configured by ``CACHE_TYPE``
+(in-process ``simple`` by default, or ``redis`` so that all workers share
+one copy). ``plot_cache`` holds rendered plot images and is configured
+separately by ``PLOT_CACHE_TYPE`` (``filesystem`` by default, bounded by
+``PLOT_CACHE_THRESHOLD`` files, or ``redis``). ``LRUCache`` is a small
+per-process cache for values that can't be pickled, like serializers.
+"""
+from collections import OrderedDict
+import hashlib
+import threading
+import time
+import uuid
+import zlib
+
+from flask import request
+from flask_cache import Cache
+
+cache = Cache()
+plot_cache = Cache()
+
+# key prefix for the pre-serialized /api/0.1/gages/map/ FeatureCollection,
+# and the key of its generation, which invalidate_geojson replaces
+GEOJSON_KEY = 'gages-geojson'
+GEOJSON_GENERATION_KEY = 'gages-geojson-generation'
+
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+class LRUCache(object):
+    """
+    Bounded least recently used cache where entries also expire after a
+    time to live.
+
+    Arguments:
+        maxsize (int): Most entries to keep before evicting the oldest used
+        ttl (float): Seconds before an entry expires
+    """
+    def __init__(self, maxsize=256, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Return the cached value for key, or default if it is missing or has
+        expired.
+        """
+        with self._lock:
+            try:
+                expires, value = self._entries.pop(key)
+            except KeyError:
+                return default
+            if expires < time.time():
+                return default
+            # re-insert to mark as most recently used
+            self._entries[key] = (expires, value)
+            return value
+
+    def set(self, key, value):
+        """
+        Store value for key, evicting the least recently used entry if the
+        cache is full.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + self.ttl, value)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_set(self, key, loader):
+        """
+        Return the cached value for key, calling loader(key) to create and
+        store it if needed. None results from loader are not cached.
+        """
+        value = self.get(key)
+        if value is None:
+            value = loader(key)
+            if value is not None:
+                self.set(key, value)
+        return value
+
+    def delete(self, key):
+        """
+        Remove key from the cache if it exists
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Remove all entries
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Gage.id -> GageKey(key, serializer) for verifying signed sample uploads
+gage_keys = LRUCache(maxsize=1024, ttl=600)
+
+
+def init_plot_cache(app):
+    """
+    Initialize ``plot_cache`` from the PLOT_CACHE_* settings of app
+    """
+    plot_cache.init_app(app, config={
+        'CACHE_TYPE': app.config['PLOT_CACHE_TYPE'],
+        'CACHE_DIR': app.config['PLOT_CACHE_DIR'],
+        'CACHE_THRESHOLD': app.config['PLOT_CACHE_THRESHOLD'],
+        'CACHE_DEFAULT_TIMEOUT': app.config['PLOT_CACHE_TIMEOUT'],
+        'CACHE_KEY_PREFIX': app.config['CACHE_KEY_PREFIX'] + 'plot:'
+    })
+
+
+def cached_document(key, build, timeout=None):
+    """
+    Return an (etag, gzipped body) tuple for key from ``cache``, calling
+    build() to create the body bytes and storing the result if needed.
+    """
+    document = cache.get(key)
+    if document is None:
+        body = build()
+        compressor = zlib.compressobj(6, zlib.DEFLATED, GZIP_WBITS)
+        document = (hashlib.md5(body).hexdigest(),
+                    compressor.compress(body) + compressor.flush())
+        cache.set(key, document, timeout=timeout)
+    return document
+
+
+def document_response(document, response_class, mimetype):
+    """
+    Build a response for a cached (etag, gzipped body) document, which is
+    sent still compressed when the client accepts gzip, and as a 304 when
+    the client already has it.
+    """
+    etag, data = document
+    if 'gzip' in request.accept_encodings:
+        response = response_class(data, mimetype=mimetype)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = response_class(zlib.decompress(data, GZIP_WBITS),
+                                  mimetype=mimetype)
+    response.vary.add('Accept-Encoding')
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+
+def geojson_key():
+    """
+    Return the key of the cached gage GeoJSON for this request. Its URLs
+    are absolute, so each host and scheme (``request.host_url``) gets its
+    own copy, and every copy is dropped at once by ``invalidate_geojson``
+    changing the generation in the key.
+    """
+    generation = cache.get(GEOJSON_GENERATION_KEY)
+    if generation is None:
+        cache.add(GEOJSON_GENERATION_KEY, uuid.uuid4().hex, timeout=0)
+        generation = cache.get(GEOJSON_GENERATION_KEY)
+    return '{0}:{1}:{2}'.format(GEOJSON_KEY, generation, request.host_url)
+
+
+def invalidate_geojson():
+    """
+    Drop the cached gage GeoJSON for every host so it is rebuilt on the
+    next request
+    """
+    cache.set(GEOJSON_GENERATION_KEY, uuid.uuid4().hex, timeout=0)
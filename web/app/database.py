@@ -10,22 +10,216 @@ db = SQLAlchemy()
 gage_sample_sql = text("""
 SELECT g.name, g.slug, s.name, s.suffix, sa.datetime, sa.value
 FROM gages g
-, LATERAL (
+CROSS JOIN LATERAL (
     SELECT *
     FROM sensors
     WHERE gage_id = g.id
     ORDER BY sensors.id
     LIMIT 1
 ) s
-, LATERAL (
-    SELECT *
-    FROM samples
-    WHERE sensor_id = s.id
-    ORDER BY samples.datetime DESC
-    LIMIT 1
-) sa
+JOIN samples sa ON sa.id = s.latest_sample_id
 ORDER BY g.name""")
 
+# Point sensors.latest_sample_id at the newest of the given samples
+# for each sensor, unless the sensor already has a newer sample
+update_latest_sql = text("""
+UPDATE sensors
+SET latest_sample_id = added.id,
+    last = added.datetime
+FROM (
+    SELECT DISTINCT ON (sensor_id) id, sensor_id, datetime
+    FROM samples
+    WHERE id = ANY(:sample_ids)
+    ORDER BY sensor_id, datetime DESC, id DESC
+) added
+WHERE sensors.id = added.sensor_id
+AND NOT EXISTS (
+    SELECT 1
+    FROM samples existing
+    WHERE existing.id = sensors.latest_sample_id
+    AND existing.datetime > added.datetime
+)""")
+
+# Bump the samples version of the sensors of the given new samples, or of
+# the given sensors, so that plots cached for an older version aren't sent
+bump_sample_versions_sql = text("""
+UPDATE sensors
+SET samples_version = samples_version + 1
+WHERE id IN (
+    SELECT sensor_id
+    FROM samples
+    WHERE id = ANY(:sample_ids)
+)""")
+
+bump_sensor_versions_sql = text("""
+UPDATE sensors
+SET samples_version = samples_version + 1
+WHERE id = ANY(:sensor_ids)""")
+
+# Add the given samples to the hourly and daily rollups of their sensors
+update_rollups_sql = text("""
+INSERT INTO sample_rollups
+    (sensor_id, period, start, minimum, maximum, total, count)
+SELECT sensor_id, period, date_trunc(period, datetime),
+       min(value), max(value), sum(value), count(value)
+FROM samples
+CROSS JOIN unnest(ARRAY['hour', 'day']) period
+WHERE id = ANY(:sample_ids)
+AND datetime IS NOT NULL
+AND value IS NOT NULL
+GROUP BY sensor_id, period, date_trunc(period, datetime)
+ON CONFLICT (sensor_id, period, start) DO UPDATE
+SET minimum = LEAST(sample_rollups.minimum, EXCLUDED.minimum),
+    maximum = GREATEST(sample_rollups.maximum, EXCLUDED.maximum),
+    total = sample_rollups.total + EXCLUDED.total,
+    count = sample_rollups.count + EXCLUDED.count""")
+
+# Drop the hourly and daily rollups that hold the given sensor and datetime
+# pairs, so that rebuild_rollups_sql can recompute them from their samples
+# after samples were changed or deleted
+delete_rollups_sql = text("""
+DELETE FROM sample_rollups r
+USING (
+    SELECT DISTINCT sensor_id, period, date_trunc(period, datetime) AS start
+    FROM unnest(CAST(:sensor_ids AS integer[]),
+                CAST(:datetimes AS timestamp[])) AS changed(sensor_id, datetime)
+    CROSS JOIN unnest(ARRAY['hour', 'day']) period
+) buckets
+WHERE r.sensor_id = buckets.sensor_id
+AND r.period = buckets.period
+AND r.start = buckets.start""")
+
+rebuild_rollups_sql = text("""
+INSERT INTO sample_rollups
+    (sensor_id, period, start, minimum, maximum, total, count)
+SELECT buckets.sensor_id, buckets.period, buckets.start,
+       min(s.value), max(s.value), sum(s.value), count(s.value)
+FROM (
+    SELECT DISTINCT sensor_id, period, date_trunc(period, datetime) AS start
+    FROM unnest(CAST(:sensor_ids AS integer[]),
+                CAST(:datetimes AS timestamp[])) AS changed(sensor_id, datetime)
+    CROSS JOIN unnest(ARRAY['hour', 'day']) period
+) buckets
+JOIN samples s
+ON s.sensor_id = buckets.sensor_id
+AND s.datetime >= buckets.start
+AND s.datetime < buckets.start + CAST('1 ' || buckets.period AS interval)
+AND s.value IS NOT NULL
+GROUP BY buckets.sensor_id, buckets.period, buckets.start""")
+
+# Learn the update interval of the given sensors from the median gap
+# between their :history latest samples, and poll them next one interval
+# after :now, when they were fetched with a new sample. Sample datetimes
+# are in each station's own time, so only the gaps between them are used.
+schedule_polls_sql = text("""
+UPDATE sensors
+SET poll_interval = learned.interval,
+    poll_misses = 0,
+    next_poll = :now + make_interval(secs => learned.interval)
+FROM (
+    SELECT s.id,
+           LEAST(GREATEST(COALESCE(gaps.interval, :default_interval),
+                          :min_interval),
+                 :max_interval)::integer AS interval
+    FROM sensors s
+    CROSS JOIN LATERAL (
+        SELECT percentile_cont(0.5) WITHIN GROUP (ORDER BY gap) AS interval
+        FROM (
+            SELECT extract(epoch FROM recent.datetime
+                           - lag(recent.datetime) OVER (ORDER BY recent.datetime))
+                       AS gap
+            FROM (
+                SELECT datetime
+                FROM samples
+                WHERE sensor_id = s.id
+                ORDER BY datetime DESC
+                LIMIT :history
+            ) recent
+        ) differences
+        WHERE gap > 0
+    ) gaps
+    WHERE s.id = ANY(:sensor_ids)
+) learned
+WHERE sensors.id = learned.id""")
+
+# Back off polling the given sensors, which failed or had no new samples,
+# doubling the wait after each miss in a row up to :max_interval
+backoff_polls_sql = text("""
+UPDATE sensors
+SET poll_misses = poll_misses + 1,
+    next_poll = :now + make_interval(secs => LEAST(
+        :min_interval * power(2, LEAST(poll_misses, 16)), :max_interval))
+WHERE id = ANY(:sensor_ids)""")
+
+# Insert a batch of remote samples, skipping any for sensors whose latest
+# sample is newer than :cutoff and any that would repeat a sensor and
+# datetime. Returns each input row's ordinal with the new sample id, or
+# the reason that it was discarded.
+add_samples_sql = text("""
+WITH input AS (
+    SELECT sensor_id, datetime, value, ordinal
+    FROM unnest(CAST(:sensor_ids AS integer[]),
+                CAST(:datetimes AS timestamp[]),
+                CAST(:values AS double precision[]))
+         WITH ORDINALITY AS batch(sensor_id, datetime, value, ordinal)
+), checked AS (
+    SELECT input.*,
+           min(input.ordinal) OVER (PARTITION BY input.sensor_id,
+                                                 input.datetime)
+               AS first_ordinal,
+           CASE WHEN latest.datetime >= :cutoff THEN 'too soon' END AS reason
+    FROM input
+    LEFT JOIN sensors s ON s.id = input.sensor_id
+    LEFT JOIN samples latest ON latest.id = s.latest_sample_id
+), inserted AS (
+    INSERT INTO samples (sensor_id, datetime, value)
+    SELECT sensor_id, datetime, value
+    FROM checked
+    WHERE reason IS NULL
+    AND ordinal = first_ordinal
+    ORDER BY ordinal
+    ON CONFLICT (sensor_id, datetime) DO NOTHING
+    RETURNING id, sensor_id, datetime
+)
+SELECT checked.ordinal,
+       CASE WHEN checked.ordinal = checked.first_ordinal THEN inserted.id END AS id,
+       COALESCE(checked.reason,
+                CASE WHEN inserted.id IS NULL
+                     OR checked.ordinal <> checked.first_ordinal
+                     THEN 'duplicate' END) AS reason
+FROM checked
+LEFT JOIN inserted
+ON inserted.sensor_id = checked.sensor_id
+AND inserted.datetime = checked.datetime
+ORDER BY checked.ordinal""")
+
+
+# Store the conditional GET validators of remote URLs, replacing any that
+# are already stored
+save_validators_sql = text("""
+INSERT INTO remote_validators (url, etag, last_modified, digest, updated)
+SELECT url, etag, last_modified, digest, :updated
+FROM unnest(CAST(:urls AS text[]),
+            CAST(:etags AS text[]),
+            CAST(:last_modifieds AS text[]),
+            CAST(:digests AS text[]))
+     AS batch(url, etag, last_modified, digest)
+ON CONFLICT (url) DO UPDATE
+SET etag = EXCLUDED.etag,
+    last_modified = EXCLUDED.last_modified,
+    digest = EXCLUDED.digest,
+    updated = EXCLUDED.updated""")
+
+# Add to the count of fetches with each outcome for a remote source
+count_fetches_sql = text("""
+INSERT INTO remote_fetch_counts (source, outcome, count)
+SELECT :source, outcome, count
+FROM unnest(CAST(:outcomes AS text[]),
+            CAST(:counts AS integer[]))
+     AS batch(outcome, count)
+ON CONFLICT (source, outcome) DO UPDATE
+SET count = remote_fetch_counts.count + EXCLUDED.count""")
+
 
 def gage_sample():
     """
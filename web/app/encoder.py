@@ -0,0 +1,100 @@
+"""
+JSON responses for the API, encoded by orjson when it is installed and by
+Flask's own encoder otherwise.
+
+``JSON_ENCODER`` picks the encoder: ``orjson``, ``stdlib``, or ``auto`` to
+use orjson if it can be imported. ``JSON_DATETIME_FORMAT`` is ``http`` for
+the RFC 1123 dates that Flask has always sent, or ``iso`` for ISO 8601.
+Pretty printed responses (``JSONIFY_PRETTYPRINT_REGULAR``), ASCII only
+responses (``JSON_AS_ASCII``), and payloads that orjson can't encode, such
+as integers wider than 64 bits, use Flask's encoder. orjson writes NaN and
+infinity as ``null`` where Flask writes the invalid ``NaN`` and
+``Infinity``, and may spell float exponents differently, which JSON
+parsers read the same.
+"""
+from datetime import date
+import uuid
+
+from flask import current_app, json, jsonify as flask_jsonify, request
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ISOJSONEncoder(json.JSONEncoder):
+    """
+    Flask's JSON encoder, but with dates and datetimes in ISO 8601
+    """
+    def default(self, o):
+        if isinstance(o, date):
+            return o.isoformat()
+        return super(ISOJSONEncoder, self).default(o)
+
+
+def init_json(app):
+    """
+    Configure JSON encoding from the JSON_ENCODER and JSON_DATETIME_FORMAT
+    settings of app
+    """
+    if app.config['JSON_DATETIME_FORMAT'] == 'iso':
+        app.json_encoder = ISOJSONEncoder
+    encoder = app.config['JSON_ENCODER']
+    if encoder == 'orjson' and orjson is None:
+        raise RuntimeError('JSON_ENCODER is orjson, but it is not installed')
+    if encoder == 'auto':
+        encoder = 'stdlib' if orjson is None else 'orjson'
+    app.extensions['json_encoder'] = encoder
+
+
+def _orjson_default(o):
+    """
+    Encode the types that Flask's encoder handles but orjson doesn't
+    """
+    if isinstance(o, date):
+        return http_date(o.timetuple())
+    if isinstance(o, uuid.UUID):
+        return str(o)
+    if hasattr(o, '__html__'):
+        return o.__html__()
+    raise TypeError(repr(o) + ' is not JSON serializable')
+
+
+def dumps(obj):
+    """
+    Return obj encoded as JSON bytes by orjson, following the app's
+    JSON_SORT_KEYS and JSON_DATETIME_FORMAT settings
+    """
+    option = orjson.OPT_NON_STR_KEYS
+    if current_app.config['JSON_SORT_KEYS']:
+        option |= orjson.OPT_SORT_KEYS
+    if current_app.config['JSON_DATETIME_FORMAT'] != 'iso':
+        option |= orjson.OPT_PASSTHROUGH_DATETIME
+    return orjson.dumps(obj, default=_orjson_default, option=option)
+
+
+def jsonify(*args, **kwargs):
+    """
+    Drop in replacement for ``flask.jsonify`` that uses the configured
+    encoder
+    """
+    if (current_app.extensions.get('json_encoder') != 'orjson' or
+            current_app.config['JSON_AS_ASCII'] or
+            (current_app.config['JSONIFY_PRETTYPRINT_REGULAR'] and
+             not request.is_xhr)):
+        return flask_jsonify(*args, **kwargs)
+    if args and kwargs:
+        raise TypeError('jsonify() behavior undefined when passed both args and kwargs')
+    elif len(args) == 1:
+        data = args[0]
+    else:
+        data = args or kwargs
+    try:
+        body = dumps(data)
+    except orjson.JSONEncodeError:
+        return flask_jsonify(*args, **kwargs)
+    return current_app.response_class(
+        body + b'\n',
+        mimetype=current_app.config.get('JSONIFY_MIMETYPE', 'application/json'))
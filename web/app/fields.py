@@ -0,0 +1,23 @@
+"""
+Limiting the fields that model serializers build, so that the links and
+related objects that weren't asked for aren't looked up at all.
+"""
+
+
+def wanted(fields, name):
+    """
+    Return True if name should be built, where fields is a set of field
+    names or None for all of them
+    """
+    return fields is None or name in fields
+
+
+def only(json_object, fields):
+    """
+    Return the json_object dict limited to fields, or unchanged if fields is
+    None
+    """
+    if fields is None:
+        return json_object
+    return dict((key, value) for key, value in json_object.items()
+                if key in fields)
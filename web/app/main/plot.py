@@ -1,46 +1,136 @@
 """
 Ways that a plot of a selected sensor can be displayed
+
+The matplotlib backend and plot style are configured once when this module
+is imported, rather than for each plot.
 """
 
-from flask import make_response, request
+from flask import current_app, request
 import datetime
-try:
-    from StringIO import StringIO
-except ImportError:
-    from io import BytesIO
+import hashlib
+from io import BytesIO
+from itertools import islice
+
+import numpy as np
 
 from .blueprint import main
+from .. import timerange
+from ..cache import plot_cache
+from ..database import db
 from ..models import Gage, Sensor, Sample, Correlation, River, Section
 
-#import PyQt5
 import matplotlib
 matplotlib.use('Cairo', force=True)
+from matplotlib import dates as mdates
 from matplotlib.backends.backend_cairo import FigureCanvasCairo as FigureCanvas
+from matplotlib.figure import Figure
+try:
+    import seaborn as sns
+except ImportError:  # plots fall back to the default matplotlib style
+    pass
+else:
+    sns.set()
+
+# shared by every figure that is created for a plot
+FIGURE_TEMPLATE = {'figsize': (8, 6), 'dpi': 80}
+
+MIMETYPES = {'png': 'image/png',
+             'jpg': 'image/jpeg'}
+
+# rows fetched from the server side cursor at a time when loading plot data
+FETCH_BATCH = 10000
+
+SAMPLE_DTYPE = np.dtype([('datetime', 'datetime64[us]'),
+                         ('value', 'float64')])
+
+# matplotlib date number of the unix epoch, for converting datetime64 arrays
+EPOCH_DATENUM = mdates.date2num(datetime.datetime(1970, 1, 1))
+MICROSECONDS_PER_DAY = 86400 * 1e6
+
+
+def downsample(x, y, max_points):
+    """
+    Reduce a time series to about max_points points for plotting, while
+    keeping its peaks.
+
+    The range of x is split into max_points / 2 equal time buckets, and the
+    minimum and maximum sample of each bucket are kept along with the first
+    and last samples, in their original order.
+
+    Arguments:
+        x (array): datetime64 array sorted in ascending order
+        y (array): float64 array of values
+        max_points (int): Target number of points
+    """
+    if max_points is None or len(x) <= max_points:
+        return x, y
+    buckets = max(max_points // 2, 1)
+    t = x.astype('int64')
+    t = t - t[0]
+    bucket = t * buckets // (t[-1] + 1)
+    # sort by bucket then value, so each bucket starts with its minimum
+    # and ends with its maximum
+    order = np.lexsort((y, bucket))
+    sorted_buckets = bucket[order]
+    edges = np.flatnonzero(sorted_buckets[1:] != sorted_buckets[:-1])
+    firsts = order[np.concatenate(([0], edges + 1))]
+    lasts = order[np.concatenate((edges, [len(order) - 1]))]
+    keep = np.unique(np.concatenate((firsts, lasts, [0, len(x) - 1])))
+    return x[keep], y[keep]
+
+
+def datenums(datetimes):
+    """
+    Convert a datetime64[us] array to matplotlib date numbers
+    """
+    return EPOCH_DATENUM + datetimes.astype('int64') / MICROSECONDS_PER_DAY
+
 
 class BasePlot(object):
     """
     Base class for all plots
     """
-    def data(self):
+    def query(self):
         """
-        Returns sensor data
+        Returns a query for the (datetime, value) of sensor samples
 
-        Defaults to data within last seven days
+        Defaults to samples within last seven days. Samples at the start
+        of the range are left out, as plots always have.
         """
+        query = db.session.query(Sample.datetime, Sample.value)\
+                          .filter(Sample.sensor_id == self.sid,
+                                  Sample.datetime.isnot(None),
+                                  Sample.value.isnot(None))
         start, end = self.startend()
-        if start and end:
-            return Sample.query.filter(start < Sample.datetime,
-                                       Sample.datetime < end,
-                                       Sample.sensor_id == self.sid)\
-                               .order_by(Sample.datetime)
-        if start:
-            return Sample.query.filter(start < Sample.datetime,
-                                       Sample.sensor_id == self.sid)\
-                               .order_by(Sample.datetime)
-        seven_ago = datetime.datetime.utcnow() - datetime.timedelta(days=7)
-        return Sample.query.filter(Sample.datetime > seven_ago,
-                                   Sample.sensor_id == self.sid)\
-                           .order_by(Sample.datetime)
+        if start is None:
+            start = datetime.datetime.utcnow() - datetime.timedelta(days=7)
+            end = None
+        return timerange.filter_range(query, Sample.datetime, start, end,
+                                      include_start=False)\
+            .order_by(Sample.datetime)
+
+    def data(self):
+        """
+        Returns sensor data as datetime64 and float64 numpy arrays
+
+        Rows are streamed from a server side cursor in batches of FETCH_BATCH
+        straight into arrays, without creating ``Sample`` objects, then
+        downsampled to about PLOT_MAX_POINTS points.
+        """
+        rows = iter(self.query().yield_per(FETCH_BATCH))
+        chunks = []
+        while True:
+            batch = list(islice(rows, FETCH_BATCH))
+            if not batch:
+                break
+            chunks.append(np.array(batch, dtype=SAMPLE_DTYPE))
+        if chunks:
+            samples = np.concatenate(chunks)
+        else:
+            samples = np.empty(0, dtype=SAMPLE_DTYPE)
+        return downsample(samples['datetime'],
+                          samples['value'],
+                          current_app.config['PLOT_MAX_POINTS'])
 
     @staticmethod
     def startend():
@@ -48,13 +138,7 @@ class BasePlot(object):
         Return datetime objects if start and end arguments are in url.
         Otherwise return None.
         """
-        start = request.args.get('start')
-        end = request.args.get('end')
-        if start:
-            start = datetime.datetime.strptime(start, '%Y%m%d')
-        if end:
-            end = datetime.datetime.strptime(end, '%Y%m%d')
-        return (start, end)
+        return timerange.startend()
 
     def _setaxislimits(self, axis, ymin, ymax):
         """
@@ -73,55 +157,45 @@ class BasePlot(object):
         else:
             axis.set_ylim(ymax=ymax+ybuff)
 
-    def png(self):
+    def render(self, fmt):
         """
-        Returns a StringIO PNG plot for the sensor
+        Returns the plot rendered as fmt ('png' or 'jpg') bytes.
+
+        The figure is cleared once it has been rendered, so that long lived
+        workers don't hold on to memory from old plots.
         """
-        
         fig = self.matplot()
-        canvas = FigureCanvas(fig)
         try:
-            png_output = StringIO()
-        except NameError:
-            png_output = BytesIO()
-        canvas.print_png(png_output)
-        return png_output.getvalue()
+            canvas = FigureCanvas(fig)
+            output = BytesIO()
+            getattr(canvas, 'print_' + fmt)(output)
+            return output.getvalue()
+        finally:
+            fig.clf()
+
+    def png(self):
+        """
+        Returns PNG plot bytes for the sensor
+        """
+        return self.render('png')
 
     def jpg(self):
         """
-        Returns a StringIO JPG plot for the sensor
+        Returns JPG plot bytes for the sensor
         """
-        fig = self.matplot()
-        canvas = FigureCanvas(fig)
-        try:
-            jpg_output = StringIO()
-        except NameError:
-            jpg_output = BytesIO()
-        canvas.print_jpg(jpg_output)
-        return jpg_output.getvalue()
+        return self.render('jpg')
 
     def _axisfigure(self):
         """
         Returns axis and figure
         """
-        #import matplotlib
-        #matplotlib.use('Qt5Agg')
-        import PyQt5
-        import matplotlib
-        matplotlib.use('Qt5Agg', force=True)
-        from matplotlib.figure import Figure
-        import seaborn as sns
-        sns.set()
-        data = self.data()
-        fig = Figure()
+        x, y = self.data()
+        fig = Figure(**FIGURE_TEMPLATE)
         ax = fig.add_subplot(1, 1, 1)
-        x = []
-        y = []
-        for sample in data:
-            x.append(sample.datetime)
-            y.append(sample.value)
-        ax.plot(x, y, '-')
-        self._setaxislimits(ax, min(y), max(y))
+        ax.plot(datenums(x), y, '-')
+        ax.xaxis_date()
+        if y.size:
+            self._setaxislimits(ax, y.min(), y.max())
         if self.sensor.name:
             ax.set_title('{0} - {1}'.format(self.sensor.gage.name, self.sensor.name))
         else:
@@ -136,6 +210,43 @@ class BasePlot(object):
         ax, fig = self._axisfigure()
         return fig
 
+    def cache_key(self, fmt):
+        """
+        Returns the key that the plot rendered as fmt is cached under.
+        It includes the ``samples_version`` of the sensor, which is bumped
+        when samples are added, resent with a new value, edited or deleted,
+        so any of those result in a new plot.
+        """
+        start, end = self.startend()
+        return '{0}:{1}:{2}:{3}:{4}:{5}'.format(
+            type(self).__name__,
+            self.sid,
+            start,
+            end,
+            fmt,
+            self.sensor.samples_version)
+
+    def response(self, fmt):
+        """
+        Returns a response with the plot rendered as fmt ('png' or 'jpg').
+
+        Rendered images are kept in ``plot_cache`` and sent with an ETag
+        and Cache-Control headers, so repeated requests skip rendering.
+        """
+        key = self.cache_key(fmt)
+        response = current_app.response_class(mimetype=MIMETYPES[fmt])
+        response.set_etag(hashlib.md5(key.encode('utf-8')).hexdigest())
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config['PLOT_MAX_AGE']
+        if request.if_none_match.contains(response.get_etag()[0]):
+            return response.make_conditional(request)
+        image = plot_cache.get(key)
+        if image is None:
+            image = getattr(self, fmt)()
+            plot_cache.set(key, image)
+        response.set_data(image)
+        return response.make_conditional(request)
+
 
 class SensorPlot(BasePlot):
     """
@@ -170,6 +281,14 @@ class CorrelationPlot(BasePlot):
         self.sid = sensor_id
         self.sensor = self.correlation.sensor
 
+    def cache_key(self, fmt):
+        """
+        Returns the key that the plot rendered as fmt is cached under,
+        including the correlated levels drawn on the plot.
+        """
+        key = super(CorrelationPlot, self).cache_key(fmt)
+        return key + ':' + ':'.join(str(level) for level in self.levels())
+
     def levels(self):
         """
         Return the correlated levels
@@ -205,9 +324,7 @@ def gagesensorplot(stype, gid=None, slug=None):
     """
     if slug:
         gid = Gage.query.filter_by(slug=slug).first_or_404().id
-    response = make_response(SensorPlot(gid, stype).png())
-    response.headers['Content-Type'] = 'image/png'
-    return response
+    return SensorPlot(gid, stype).response('png')
 
 
 @main.route('/gage/<int:gid>/<stype>.jpg')
@@ -222,9 +339,7 @@ def gagesensorplotjpg(stype, gid=None, slug=None):
     """
     if slug:
         gid = Gage.query.filter_by(slug=slug).first_or_404().id
-    response = make_response(SensorPlot(gid, stype).jpg())
-    response.headers['Content-Type'] = 'image/jpeg'
-    return response
+    return SensorPlot(gid, stype).response('jpg')
 
 
 @main.route('/river/<river>/<section>/<gage>/<stype>.png')
@@ -238,7 +353,4 @@ def correlationplotpng(stype, gage, section, river):
                                            Sensor.stype==stype,
                                            Gage.slug==gage)\
                                    .first_or_404()
-    print(correlation)
-    response = make_response(CorrelationPlot(correlation.section.id, correlation.sensor.id).png())
-    response.headers['Content-Type'] = 'image/png'
-    return response
+    return CorrelationPlot(correlation.section.id, correlation.sensor.id).response('png')
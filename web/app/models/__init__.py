@@ -10,3 +10,5 @@ from .section import Section  # noqa
 from .gage import Gage  # noqa
 from .sensor import Sensor  # noqa
 from .sample import Sample  # noqa
+from .rollup import SampleRollup  # noqa
+from .remote import RemoteValidator, RemoteFetchCount  # noqa
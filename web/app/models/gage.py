@@ -1,11 +1,20 @@
 """
 Gage model
 """
-from flask import url_for
+from collections import defaultdict
+import datetime
+
+from dateutil.parser import parse as parse_datetime
 from geoalchemy2 import Geometry
 from geoalchemy2.shape import to_shape
+from sqlalchemy import func, literal_column
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import defer, subqueryload
 
 from app.database import db
+from app.fields import only, wanted
+from app.urls import external_url
+from .rollup import rebuild_rollups
 from .sensor import Sensor
 from .sample import Sample
 
@@ -84,23 +93,30 @@ class Gage(db.Model):
         latlon_point = to_shape(self.point)
         return latlon_point
 
-    def to_json(self):
+    def to_json(self, fields=None):
         """
         Creates a JSON Object from Gage. Used where multiple gages may be
-        listed at once.
+        listed at once. Only builds fields if given.
+        """
+        return self.summary_json(self.id, self.name, self.location, self.slug,
+                                 fields)
+
+    @staticmethod
+    def summary_json(gid, name, location, slug, fields=None):
+        """
+        Build the JSON Object from ``to_json`` out of the gage's columns,
+        for when the ``Gage`` itself hasn't been loaded.
         """
         json_post = {
-            'id': self.id,
-            'name': self.name,
-            'location': self.location,
-            'html': url_for('main.gagepage',
-                            slug=self.slug,
-                            _external=True),
-            'url': url_for('api.get_gage',
-                           gid=self.id,
-                           _external=True)
+            'id': gid,
+            'name': name,
+            'location': location,
         }
-        return json_post
+        if wanted(fields, 'html'):
+            json_post['html'] = external_url('main.gagepage', slug=slug)
+        if wanted(fields, 'url'):
+            json_post['url'] = external_url('api.get_gage', gid=gid)
+        return only(json_post, fields)
 
     def to_long_json(self):
         """
@@ -110,41 +126,71 @@ class Gage(db.Model):
             'id': self.id,
             'name': self.name,
             'location': self.location,
-            'url': url_for('api.get_gage',
-                           gid=self.id,
-                           _external=True),
-            'html': url_for('main.gagepage',
-                            slug=self.slug,
-                            _external=True),
+            'url': external_url('api.get_gage', gid=self.id),
+            'html': external_url('main.gagepage', slug=self.slug),
             'sensors': [sensor.to_gage_json() for sensor in self.sensors],
             'regions': [region.to_json() for region in self.regions]
         }
         return json_post
 
-    def geojson(self):
+    def geojson(self, coordinates=None, sensors=None):
         """
         Creates a GeoJSON Feature from the gage
+
+        Arguments:
+            coordinates (list): [longitude, latitude] of the gage if already
+                                known, otherwise they are decoded from point.
+            sensors (list): ``Sensor`` objects of the gage if already loaded.
         """
-        point = self.latlon()
+        if coordinates is None:
+            point = self.latlon()
+            coordinates = [point.x, point.y]
+        if sensors is None:
+            sensors = self.sensors
         geojson = {
             'type': 'Feature',
             'geometry': {
                 'type': 'Point',
-                'coordinates': [point.x, point.y]
+                'coordinates': coordinates
             },
             'properties': {
                 'name': self.name,
                 'location': self.location,
                 'id': self.id,
-                'html': url_for('main.gagepage',
-                                slug=self.slug,
-                                _external=True),
-                'sensors': [sensor.to_gage_json() for sensor in self.sensors],
+                'html': external_url('main.gagepage', slug=self.slug),
+                'sensors': [sensor.to_gage_json() for sensor in sensors],
                 'regions': [region.to_json() for region in self.regions]
             }
         }
         return geojson
 
+    @classmethod
+    def geojson_collection(cls):
+        """
+        Creates a GeoJSON FeatureCollection of all gages.
+
+        Coordinates are computed by PostGIS, regions are loaded together, and
+        sensors are loaded with their latest samples in one query, so the
+        number of queries does not depend on the number of gages.
+        """
+        gages = db.session.query(cls,
+                                 func.ST_X(cls.point),
+                                 func.ST_Y(cls.point))\
+                          .options(defer(cls.point),
+                                   subqueryload(cls.regions))\
+                          .order_by(cls.id)\
+                          .all()
+        sensors = defaultdict(list)
+        for sensor in Sensor.query.filter(Sensor.gage_id.isnot(None))\
+                                  .order_by(Sensor.id):
+            sensors[sensor.gage_id].append(sensor)
+        return {
+            'type': 'FeatureCollection',
+            'features': [gage.geojson(coordinates=[x, y],
+                                      sensors=sensors[gage.id])
+                         for gage, x, y in gages]
+        }
+
     def new_sample(self, stype, value, sdatetime):
         """
         Process a new sample for the gage, and finds the right ``Sensor`` that
@@ -165,9 +211,109 @@ class Gage(db.Model):
             db.session.commit()
         sample = Sample(sensor_id=sensor.id, value=value, datetime=sdatetime)
         db.session.add(sample)
+        db.session.flush()
+        Sensor.samples_added([sample.id], rolled_up=True)
         db.session.commit()
         return sample
 
+    def new_samples(self, samples):
+        """
+        Process a batch of new samples for the gage with ``add_samples``.
+
+        Arguments:
+            samples (list): Sample dicts with ``type``, ``value``,
+                            and ``datetime`` keys
+
+        Returns a list of ``Sample`` objects in the same order as ``samples``.
+        """
+        return self.add_samples(self.id, samples)
+
+    @staticmethod
+    def add_samples(gid, samples):
+        """
+        Process a batch of new samples for gage *gid* in a single transaction,
+        without loading the ``Gage``.
+        All ``Sensor`` objects for the gage are looked up with one query, any
+        missing sensors are created together, and every ``Sample`` is inserted
+        with a single multi-row ``INSERT ... RETURNING``. A sample for a sensor
+        and datetime that already exists (such as when a gage resends a
+        batch) replaces the value of the existing one, and the rollups that
+        hold it are rebuilt.
+
+        Arguments:
+            gid (int): Primary key of the gage
+            samples (list): Sample dicts with ``type``, ``value``,
+                            and ``datetime`` keys
+
+        Returns a list of ``Sample`` objects in the same order as ``samples``.
+        """
+        if not samples:
+            return []
+        sensors = Sensor.__table__
+        stypes = set(sample['type'].lower() for sample in samples)
+        # ordered so that the oldest sensor wins if a type is duplicated,
+        # matching the .first() lookup in new_sample
+        sensor_ids = dict(db.session.query(Sensor.stype, Sensor.id)
+                                    .filter(Sensor.gage_id == gid)
+                                    .filter(Sensor.stype.in_(stypes))
+                                    .order_by(Sensor.id.desc())
+                                    .all())
+        missing = stypes.difference(sensor_ids)
+        if missing:
+            created = db.session.execute(
+                sensors.insert()
+                       .values([{'gage_id': gid,
+                                 'stype': stype,
+                                 'local': True} for stype in missing])
+                       .returning(sensors.c.stype, sensors.c.id))
+            sensor_ids.update(created.fetchall())
+        # a row can only be inserted or updated once per statement, so
+        # repeats within the batch share a row and the last value wins.
+        # Repeats are found by the timestamp that will be stored, as the same
+        # time can be sent as different strings, and a timestamp column
+        # drops any offset.
+        rows = []
+        row_index = {}
+        positions = []
+        for sample in samples:
+            sdatetime = sample['datetime']
+            if not isinstance(sdatetime, datetime.datetime):
+                sdatetime = parse_datetime(sdatetime)
+            key = (sensor_ids[sample['type'].lower()],
+                   sdatetime.replace(tzinfo=None))
+            row = {'sensor_id': key[0],
+                   'value': sample['value'],
+                   'datetime': key[1]}
+            if key in row_index:
+                rows[row_index[key]] = row
+            else:
+                row_index[key] = len(rows)
+                rows.append(row)
+            positions.append(row_index[key])
+        table = Sample.__table__
+        statement = insert(table).values(rows)
+        statement = statement.on_conflict_do_update(
+            constraint='uq_samples_sensor_id_datetime',
+            set_={'value': statement.excluded.value})
+        # PostgreSQL returns rows from INSERT ... VALUES in the order given
+        inserted = db.session.execute(
+            statement.returning(table.c.id,
+                                table.c.sensor_id,
+                                table.c.value,
+                                table.c.datetime,
+                                literal_column('xmax = 0').label('new'))
+        ).fetchall()
+        Sensor.samples_added([row.id for row in inserted if row.new])
+        rebuild_rollups(db.session.connection(),
+                        [(row.sensor_id, row.datetime)
+                         for row in inserted if not row.new])
+        db.session.commit()
+        return [Sample(id=row.id,
+                       sensor_id=row.sensor_id,
+                       value=row.value,
+                       datetime=row.datetime)
+                for row in (inserted[position] for position in positions)]
+
     def __repr__(self):
         return '<Gage %r>' % self.name
 
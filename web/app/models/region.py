@@ -1,9 +1,10 @@
 """
 Region model
 """
-from flask import url_for
 
 from app.database import db
+from app.fields import only, wanted
+from app.urls import external_url
 
 
 class Region(db.Model):
@@ -30,18 +31,20 @@ class Region(db.Model):
     short_description = db.Column(db.Text)
     header_image = db.Column(db.String(80))
 
-    def to_json(self):
+    def to_json(self, fields=None):
         """
         Create a JSON object from region. Used where multiple regions may be
-        displayed simultaneously.
+        displayed simultaneously. Only builds fields if given.
         """
         json_region = {
             'id': self.id,
             'name': self.name,
-            'url': url_for('api.get_region', rid=self.id, _external=True),
-            'html': url_for('main.regionpage', slug=self.slug, _external=True),
         }
-        return json_region
+        if wanted(fields, 'url'):
+            json_region['url'] = external_url('api.get_region', rid=self.id)
+        if wanted(fields, 'html'):
+            json_region['html'] = external_url('main.regionpage', slug=self.slug)
+        return only(json_region, fields)
 
     def to_long_json(self):
         """
@@ -55,8 +58,8 @@ class Region(db.Model):
             'sections': [section.to_json() for section in self.sections],
             'gages': [gage.to_json() for gage in self.gages],
             'rivers': [river.to_json for river in self.rivers],
-            'url': url_for('api.get_region', rid=self.id, _external=True),
-            'html': url_for('main.regionpage', slug=self.slug, _external=True)
+            'url': external_url('api.get_region', rid=self.id),
+            'html': external_url('main.regionpage', slug=self.slug)
         }
         return json_region
 
@@ -0,0 +1,47 @@
+"""
+Models for the state that remote fetches keep between runs
+"""
+from app.database import db
+
+
+class RemoteValidator(db.Model):
+    """
+    ETag, Last-Modified and body hash of the last fetch of a remote URL, so
+    that the next fetch can be conditional. See ``app.remote.validators``.
+
+    Arguments:
+        url (str): URL that was fetched
+        etag (str): ETag header of the response
+        last_modified (str): Last-Modified header of the response
+        digest (str): Hash of the response body
+        updated (datetime): When the validator was stored
+    """
+    __tablename__ = 'remote_validators'
+
+    url = db.Column(db.Text, primary_key=True)
+    etag = db.Column(db.Text)
+    last_modified = db.Column(db.Text)
+    digest = db.Column(db.Text)
+    updated = db.Column(db.DateTime, index=True)
+
+    def __repr__(self):
+        return '<RemoteValidator %r>' % self.url
+
+
+class RemoteFetchCount(db.Model):
+    """
+    Number of fetches from a remote source with an outcome
+
+    Arguments:
+        source (str): Name of the ``RemoteGage`` class
+        outcome (str): One of ``app.remote.validators.OUTCOMES``
+        count (int): Number of fetches
+    """
+    __tablename__ = 'remote_fetch_counts'
+
+    source = db.Column(db.String(80), primary_key=True)
+    outcome = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return '<RemoteFetchCount {0} {1}>'.format(self.source, self.outcome)
@@ -1,8 +1,9 @@
 """
 River model
 """
-from flask import url_for
 from app.database import db
+from app.fields import only, wanted
+from app.urls import external_url
 
 # many to many table to connect rivers to regions
 rivers_regions = db.Table('rivers_regions',
@@ -53,18 +54,20 @@ class River(db.Model):
     #    self.header_image = header_image
     #    self.parent = parent
 
-    def to_json(self):
+    def to_json(self, fields=None):
         """
         Creates a JSON Object from River. Used where multiple rivers may be
-        listed at once.
+        listed at once. Only builds fields if given.
         """
         json_river = {
             'id': self.id,
             'name': self.name,
-            'html': url_for('main.riverpage', slug=self.slug, _external=True),
-            'url': url_for('api.get_river', rid=self.id, _external=True),
         }
-        return json_river
+        if wanted(fields, 'html'):
+            json_river['html'] = external_url('main.riverpage', slug=self.slug)
+        if wanted(fields, 'url'):
+            json_river['url'] = external_url('api.get_river', rid=self.id)
+        return only(json_river, fields)
 
     def to_long_json(self):
         """
@@ -74,8 +77,8 @@ class River(db.Model):
         json_river = {
             'id': self.id,
             'name': self.name,
-            'html': url_for('main.riverpage', slug=self.slug, _external=True),
-            'url': url_for('api.get_river', rid=self.id, _external=True),
+            'html': external_url('main.riverpage', slug=self.slug),
+            'url': external_url('api.get_river', rid=self.id),
             'regions': [region.to_json() for region in self.regions],
             'sections': [section.to_json() for section in self.sections],
             'tributaries': [river.to_json() for river in self.tributary],
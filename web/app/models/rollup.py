@@ -0,0 +1,157 @@
+"""
+Model for hourly and daily rollups of samples
+"""
+from sqlalchemy import event, extract, func, inspect
+
+from app.database import (db, bump_sensor_versions_sql, delete_rollups_sql,
+                          rebuild_rollups_sql)
+from .sample import Sample
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+
+def bucket_start(column, seconds):
+    """
+    SQL expression for the start of the seconds wide bucket that the
+    datetime column falls in
+    """
+    epoch = func.floor(extract('epoch', column) / seconds) * seconds
+    return func.timezone('UTC', func.to_timestamp(epoch))
+
+
+def rebuild_rollups(connection, changed):
+    """
+    Recompute the hourly and daily rollups that hold the (sensor id,
+    datetime) pairs in changed from their samples, for samples that were
+    changed or deleted after they were rolled up, and bump the
+    ``samples_version`` of their sensors.
+
+    Arguments:
+        connection: Connection of the transaction that changed the samples
+        changed (iterable): (sensor id, datetime) pairs
+    """
+    changed = [(sensor_id, dt) for sensor_id, dt in changed
+               if sensor_id is not None and dt is not None]
+    if changed:
+        params = {'sensor_ids': [pair[0] for pair in changed],
+                  'datetimes': [pair[1] for pair in changed]}
+        connection.execute(delete_rollups_sql, params)
+        connection.execute(rebuild_rollups_sql, params)
+        connection.execute(bump_sensor_versions_sql,
+                           {'sensor_ids': list(set(params['sensor_ids']))})
+
+
+@event.listens_for(Sample, 'after_insert')
+def sample_inserted(mapper, connection, target):
+    """
+    Rebuild the rollups that a sample added through the ORM, such as from
+    the admin or a script, is in. Samples inserted with a statement are
+    rolled up by ``Sensor.samples_added`` instead.
+    """
+    rebuild_rollups(connection, [(target.sensor_id, target.datetime)])
+
+
+@event.listens_for(Sample, 'after_update')
+def sample_updated(mapper, connection, target):
+    """
+    Rebuild the rollups that an edited sample was and now is in
+    """
+    state = inspect(target)
+    if not any(state.attrs[name].history.has_changes()
+               for name in ('sensor_id', 'datetime', 'value')):
+        return
+    changed = [(target.sensor_id, target.datetime)]
+    sensor_id = state.attrs.sensor_id.history.deleted
+    dt = state.attrs.datetime.history.deleted
+    if sensor_id or dt:
+        changed.append((sensor_id[0] if sensor_id else target.sensor_id,
+                        dt[0] if dt else target.datetime))
+    rebuild_rollups(connection, changed)
+
+
+@event.listens_for(Sample, 'after_delete')
+def sample_deleted(mapper, connection, target):
+    """
+    Rebuild the rollups that a deleted sample was in
+    """
+    rebuild_rollups(connection, [(target.sensor_id, target.datetime)])
+
+
+class SampleRollup(db.Model):
+    """
+    Aggregated samples for a sensor over an hour or a day. Rollups are
+    updated as samples are added with a statement, see
+    ``Sensor.samples_added``, and rebuilt when samples are added through the
+    ORM, edited or deleted, see ``rebuild_rollups``.
+
+    Arguments:
+        sensor_id (int): Foreign ``Sensor``.id key
+        sensor: ``Sensor`` object the samples are from
+        period (str): ``'hour'`` or ``'day'``
+        start (datetime): Start of the hour or day (in UTC)
+        minimum (float): Lowest sample value
+        maximum (float): Highest sample value
+        total (float): Sum of sample values
+        count (int): Number of samples
+    """
+    __tablename__ = 'sample_rollups'
+
+    sensor_id = db.Column(db.Integer,
+                          db.ForeignKey('sensors.id', ondelete='CASCADE'),
+                          primary_key=True)
+    sensor = db.relationship('Sensor')
+
+    period = db.Column(db.String(8), primary_key=True)
+    start = db.Column(db.DateTime, primary_key=True)
+    minimum = db.Column(db.Float)
+    maximum = db.Column(db.Float)
+    total = db.Column(db.Float)
+    count = db.Column(db.Integer)
+
+    PERIODS = {HOUR: 'hour', DAY: 'day'}
+
+    @classmethod
+    def aggregate(cls, sensor_id, seconds, start=None, end=None):
+        """
+        Returns (start, minimum, maximum, mean, count) rows for each bucket of
+        seconds with samples for sensor between start and end.
+
+        Buckets that are whole days or hours are built from the rollups,
+        anything else is computed from the samples.
+        """
+        if seconds % DAY == 0 or seconds % HOUR == 0:
+            source = DAY if seconds % DAY == 0 else HOUR
+            if seconds == source:
+                bucket = cls.start
+            else:
+                bucket = bucket_start(cls.start, seconds)
+            query = db.session.query(bucket.label('start'),
+                                     func.min(cls.minimum).label('minimum'),
+                                     func.max(cls.maximum).label('maximum'),
+                                     (func.sum(cls.total) /
+                                      func.sum(cls.count)).label('mean'),
+                                     func.sum(cls.count).label('count'))\
+                              .filter(cls.sensor_id == sensor_id,
+                                      cls.period == cls.PERIODS[source])
+            column = cls.start
+        else:
+            bucket = bucket_start(Sample.datetime, seconds)
+            query = db.session.query(bucket.label('start'),
+                                     func.min(Sample.value).label('minimum'),
+                                     func.max(Sample.value).label('maximum'),
+                                     func.avg(Sample.value).label('mean'),
+                                     func.count(Sample.value).label('count'))\
+                              .filter(Sample.sensor_id == sensor_id,
+                                      Sample.value.isnot(None))
+            column = Sample.datetime
+        if start is not None:
+            query = query.filter(column >= start)
+        if end is not None:
+            query = query.filter(column < end)
+        return query.group_by(bucket).order_by(bucket).all()
+
+    def __repr__(self):
+        return '<SampleRollup {0} {1} {2}>'.format(self.sensor_id,
+                                                   self.period,
+                                                   self.start)
@@ -1,9 +1,10 @@
 """
 Model for sample
 """
-from flask import url_for
 
 from app.database import db
+from app.fields import only, wanted
+from app.urls import external_url
 
 
 class Sample(db.Model):
@@ -18,40 +19,55 @@ class Sample(db.Model):
         value (float): Value of sample
     """
     __tablename__ = 'samples'
+    __table_args__ = (
+        db.UniqueConstraint('sensor_id', 'datetime',
+                            name='uq_samples_sensor_id_datetime'),
+        # keyset pagination orders by (datetime, id)
+        db.Index('ix_samples_datetime_id', 'datetime', 'id'),
+        db.Index('ix_samples_sensor_id_datetime_id',
+                 'sensor_id', 'datetime', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
 
     sensor_id = db.Column(db.Integer, db.ForeignKey('sensors.id'), index=True)
-    sensor = db.relationship('Sensor', backref=db.backref('samples'))
+    sensor = db.relationship('Sensor',
+                             foreign_keys=[sensor_id],
+                             backref=db.backref('samples'))
 
     datetime = db.Column(db.DateTime, index=True)
     value = db.Column(db.Float)
 
-    def to_json(self):
+    def to_json(self, fields=None):
         """
         Creates a JSON object from Sample. Used where multiple samples will be
-        displayed at once.
+        displayed at once. Only builds fields if given, so the sensor and
+        gage aren't loaded unless ``sensor`` is wanted.
         """
         json_sample = {
             'id': self.id,
-            'sensor': self.sensor.to_sample_json(),
             'value': self.value,
             'datetime': self.datetime,
-            'url': url_for('api.get_sample', sid=self.id, _external=True)
         }
-        return json_sample
+        if wanted(fields, 'sensor'):
+            json_sample['sensor'] = self.sensor.to_sample_json()
+        if wanted(fields, 'url'):
+            json_sample['url'] = external_url('api.get_sample', sid=self.id)
+        return only(json_sample, fields)
 
-    def to_sensor_json(self):
+    def to_sensor_json(self, fields=None):
         """
-        Creates a JSON object from Sample for used with Sensor JSON.
+        Creates a JSON object from Sample for used with Sensor JSON. Only
+        builds fields if given.
         """
         json_sample = {
             'id': self.id,
             'value': self.value,
             'datetime': str(self.datetime),
-            'url': url_for('api.get_sample', sid=self.id, _external=True)
         }
-        return json_sample
+        if wanted(fields, 'url'):
+            json_sample['url'] = external_url('api.get_sample', sid=self.id)
+        return only(json_sample, fields)
 
     def __repr__(self):
         return '<Sample %r>' % self.id
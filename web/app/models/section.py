@@ -1,12 +1,13 @@
 """
 Model for section
 """
-from flask import url_for
 from geoalchemy2 import Geometry
 from geoalchemy2.shape import to_shape
 from shapely.geometry import mapping
 
 from app.database import db
+from app.fields import only, wanted
+from app.urls import external_url
 
 
 # many to many relationship table for sections and regions
@@ -88,23 +89,22 @@ class Section(db.Model):
             return None
         return latlon_point
 
-    def to_json(self):
+    def to_json(self, fields=None):
         """
         Creates a JSON Object from Section. Used where multiple sections may be
-        listed at once.
+        listed at once. Only builds fields if given.
         """
         json_section = {
             'id': self.id,
             'name': self.name,
-            'html': url_for('main.sectionpage',
-                            slug=self.slug,
-                            river=self.river.slug,
-                            _external=True),
-            'url': url_for('api.get_section',
-                           sid=self.id,
-                           _external=True)
         }
-        return json_section
+        if wanted(fields, 'html'):
+            json_section['html'] = external_url('main.sectionpage',
+                                                slug=self.slug,
+                                                river=self.river.slug)
+        if wanted(fields, 'url'):
+            json_section['url'] = external_url('api.get_section', sid=self.id)
+        return only(json_section, fields)
 
     def to_long_json(self):
         """
@@ -114,11 +114,10 @@ class Section(db.Model):
         json_section = {
             'id': self.id,
             'name': self.name,
-            'html': url_for('main.sectionpage',
-                            slug=self.slug,
-                            river=self.river.slug,
-                            _external=True),
-            'url': url_for('api.get_section', sid=self.id, _external=True),
+            'html': external_url('main.sectionpage',
+                                 slug=self.slug,
+                                 river=self.river.slug),
+            'url': external_url('api.get_section', sid=self.id),
             'regions': [region.to_json() for region in self.regions],
             'sensors': [correlation.sensor.to_json()
                         for correlation in self.correlations],
@@ -2,10 +2,14 @@
 Model for sensor
 """
 import datetime
-from flask import url_for, current_app
+from flask import current_app
 from sqlalchemy.dialects.postgresql import JSON
 
-from app.database import db
+from app.database import (db, update_latest_sql, update_rollups_sql,
+                          bump_sample_versions_sql, schedule_polls_sql,
+                          backoff_polls_sql)
+from app.fields import only, wanted
+from app.urls import external_url
 from .sample import Sample
 
 
@@ -27,6 +31,12 @@ class Sensor(db.Model):
         remote_id (int): String element that should be used to query remote sensor.
         remote_parameter (str): Parameter that is required to query remote sensor.
         last (datetime): Last time data was received or retrieved.
+        latest_sample_id (int): Foreign ``Sample``.id of the most recent sample
+        latest_sample: Most recent ``Sample`` object, kept up to date when samples are added.
+        poll_interval (int): Seconds between the remote sensor's updates, learned from its samples.
+        next_poll (datetime): When the remote sensor should next be fetched.
+        poll_misses (int): Fetches in a row that failed or had no new samples.
+        samples_version (int): Bumped whenever samples of the sensor are added, changed or deleted.
         title (str): Title to display on plots.
         xlabel (str): x-axis label to display on plots.
         ylabel (str): y-axis label to display on plots.
@@ -57,6 +67,21 @@ class Sensor(db.Model):
     remote_id = db.Column(db.String)
     remote_parameter = db.Column(db.String)
     last = db.Column(db.DateTime)
+    latest_sample_id = db.Column(db.Integer,
+                                 db.ForeignKey('samples.id',
+                                               use_alter=True,
+                                               name='fk_sensors_latest_sample_id',
+                                               ondelete='SET NULL'))
+    latest_sample = db.relationship('Sample',
+                                    foreign_keys=[latest_sample_id],
+                                    post_update=True,
+                                    lazy='joined')
+    poll_interval = db.Column(db.Integer)
+    next_poll = db.Column(db.DateTime)
+    poll_misses = db.Column(db.Integer, nullable=False, default=0,
+                            server_default='0')
+    samples_version = db.Column(db.Integer, nullable=False, default=0,
+                                server_default='0')
     title = db.Column(db.String)
     xlabel = db.Column(db.String)
     ylabel = db.Column(db.String)
@@ -80,22 +105,96 @@ class Sensor(db.Model):
         """
         Return recent sample value.
         """
-        current_app.logger.debug('Recent for sensor {name}'.format(name=self.name))
-        sample = Sample.query.filter_by(sensor_id=self.id).order_by(Sample.datetime.desc()).first()
-        current_app.logger.debug('Retrieved sample: {sample}'.format(sample=sample))
-        return sample
+        return self.latest_sample
 
-    def to_json(self):
+    @staticmethod
+    def samples_added(sample_ids, rolled_up=False):
+        """
+        Update what is kept about newly added samples: point
+        ``latest_sample`` of their sensors at the newest of them (unless the
+        sensor already has a newer sample), add them to the hourly and
+        daily ``SampleRollup`` rows, and bump ``samples_version``. Runs in
+        the current transaction, so call before committing.
+
+        Arguments:
+            sample_ids (list): Primary keys of the new ``Sample`` objects
+            rolled_up (bool): True for samples added through the ORM, which
+                              were already rolled up as they were inserted
+        """
+        if sample_ids:
+            params = {'sample_ids': list(sample_ids)}
+            db.session.execute(update_latest_sql, params)
+            if not rolled_up:
+                db.session.execute(update_rollups_sql, params)
+                db.session.execute(bump_sample_versions_sql, params)
+
+    @staticmethod
+    def remote_due(now=None):
+        """
+        Return a query of the remote sensors that are due to be fetched
+        """
+        now = now or datetime.datetime.now()
+        return Sensor.query.filter(Sensor.local == False,
+                                   db.or_(Sensor.next_poll == None,
+                                          Sensor.next_poll <= now))  # noqa
+
+    @staticmethod
+    def lease_polls(sensor_ids, now=None):
+        """
+        Put off polling sensor_ids for REMOTE_POLL_MIN seconds while they are
+        being fetched, so they aren't queued again in the meantime
+        """
+        if sensor_ids:
+            next_poll = (now or datetime.datetime.now()) + datetime.timedelta(
+                seconds=current_app.config['REMOTE_POLL_MIN'])
+            Sensor.query.filter(Sensor.id.in_(sensor_ids))\
+                        .update({Sensor.next_poll: next_poll},
+                                synchronize_session=False)
+
+    @staticmethod
+    def schedule_polls(updated_ids, missed_ids, now=None):
+        """
+        Schedule when remote sensors are next fetched. Sensors with new
+        samples learn their update interval and are polled again one
+        interval after now, and sensors that failed or had no new samples
+        back off. Runs in the current transaction, so call before
+        committing.
+
+        ``next_poll`` is anchored at the fetch rather than at the sample's
+        own time, which is in the station's time zone, so a new sample can
+        be picked up as much as one interval after it was published.
+
+        Arguments:
+            updated_ids (iterable): ``Sensor`` ids that had new samples
+            missed_ids (iterable): ``Sensor`` ids that failed or had none
+        """
+        config = current_app.config
+        params = {
+            'now': now or datetime.datetime.now(),
+            'min_interval': config['REMOTE_POLL_MIN'],
+            'max_interval': config['REMOTE_POLL_MAX']
+        }
+        if updated_ids:
+            db.session.execute(schedule_polls_sql, dict(
+                params, sensor_ids=list(updated_ids),
+                default_interval=config['REMOTE_POLL_DEFAULT'],
+                history=config['REMOTE_POLL_HISTORY']))
+        if missed_ids:
+            db.session.execute(backoff_polls_sql,
+                               dict(params, sensor_ids=list(missed_ids)))
+
+    def to_json(self, fields=None):
         """
         Creates a JSON object from sensor. Used where multiple sensors may be
-        displayed at once.
+        displayed at once. Only builds fields if given.
         """
         json_post = {
             'id': self.id,
             'type': self.stype,
-            'url': url_for('api.get_sensor', sid=self.id, _external=True)
         }
-        return json_post
+        if wanted(fields, 'url'):
+            json_post['url'] = external_url('api.get_sensor', sid=self.id)
+        return only(json_post, fields)
 
     def to_long_json(self):
         """
@@ -111,7 +210,7 @@ class Sensor(db.Model):
             'maximum': self.maximum,
             'started': self.started,
             'ended': self.ended,
-            'url': url_for('api.get_sensor', sid=self.id, _external=True),
+            'url': external_url('api.get_sensor', sid=self.id),
             'gage': self.gage.to_json()
         }
         if sample is not None:
@@ -127,7 +226,7 @@ class Sensor(db.Model):
         json_post = {
             'id': self.id,
             'type': self.stype,
-            'url': url_for('api.get_sensor', sid=self.id, _external=True)
+            'url': external_url('api.get_sensor', sid=self.id)
         }
         if sample is not None:
             json_post['recent_sample'] = sample.to_sensor_json()
@@ -142,7 +241,7 @@ class Sensor(db.Model):
             'id': self.id,
             'type': self.stype,
             'gage': self.gage.to_json(),
-            'url': url_for('api.get_sensor', sid=self.id, _external=True)
+            'url': external_url('api.get_sensor', sid=self.id)
         }
         return json_sensor
 
@@ -1 +1,15 @@
-from .base import add_new_sample
+from .base import add_new_sample, add_new_samples
+from .cawateroffice import WaterOffice
+from .cehq import CEHQ
+from .corps import Corps
+from .h2oline import H2Oline
+from .usgs import USGS
+
+# Sensor.remote_type -> source
+remote_gages = {
+    'h2oline': H2Oline(),
+    'usgs': USGS(),
+    'cehq': CEHQ(),
+    'cawater': WaterOffice(),
+    'corps': Corps()
+}
@@ -0,0 +1,138 @@
+"""
+asyncio engine that fetches every remote sensor in one event loop
+
+Instead of fanning chunks out to Celery workers that each block on HTTP,
+all of the requests from each source's ``requests_for`` are made
+concurrently over one shared aiohttp connection pool, with at most
+HOST_CONCURRENCY requests to any one host at a time. Requests are
+conditional like those of ``RemoteGage.get_multiple_samples``, and parsed
+samples are saved together once everything has been fetched.
+"""
+import asyncio
+from collections import defaultdict
+import logging
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from app.database import db
+from app.models import Sensor
+from . import remote_gages
+from .base import BODY_CHUNK, FetchResult, save_fetch_results, trim_tail
+from .validators import FAILED, load_validators
+
+logger = logging.getLogger(__name__)
+
+HOST_CONCURRENCY = 4
+CONNECTIONS = 100
+# seconds for each request, including reading the body
+TIMEOUT = 60
+
+
+async def read_tail(stream, size):
+    """
+    Return the last size bytes of an ``aiohttp.StreamReader``, without
+    holding more than about twice that at once
+    """
+    buf = bytearray()
+    async for chunk in stream.iter_chunked(BODY_CHUNK):
+        buf += chunk
+        trim_tail(buf, size)
+    return bytes(buf[-size:])
+
+
+async def fetch_request(session, limits, source, url, sensors, validator):
+    """
+    Fetch and parse one (url, sensors) pair from a source's requests_for,
+    conditional on validator, and return a ``FetchResult``
+    """
+    try:
+        async with limits[urlsplit(url).hostname]:
+            async with session.get(
+                    url, headers=source.request_headers(validator)) as response:
+                response.raise_for_status()
+                if source.TAIL_BYTES is None:
+                    content = await response.read()
+                else:
+                    content = await read_tail(response.content,
+                                              source.TAIL_BYTES)
+                encoding = None
+                if response.status != 304:
+                    encoding = response.get_encoding()
+        return source.handle_response(url, sensors, validator,
+                                      response.status, response.headers,
+                                      content, encoding)
+    except Exception:
+        sensor_ids = [sensor[0] for sensor in sensors]
+        logger.exception('Unable to fetch samples for sensors %s from %s',
+                         sensor_ids, url)
+        return FetchResult(type(source).__name__, url, FAILED, None, [],
+                           sensor_ids)
+
+
+async def fetch_all(fetches):
+    """
+    Fetch (source, url, sensors, validator) tuples concurrently and return
+    a ``FetchResult`` for each
+    """
+    limits = defaultdict(lambda: asyncio.Semaphore(HOST_CONCURRENCY))
+    connector = aiohttp.TCPConnector(limit=CONNECTIONS)
+    timeout = aiohttp.ClientTimeout(total=TIMEOUT)
+    async with aiohttp.ClientSession(connector=connector,
+                                     timeout=timeout) as session:
+        return await asyncio.gather(*[
+            fetch_request(session, limits, source, url, sensors, validator)
+            for source, url, sensors, validator in fetches])
+
+
+def remote_fetches(sensors):
+    """
+    Return (source, url, sensors) tuples for (id, remote_type, remote_id,
+    remote_parameter) sensor tuples, skipping unknown remote types
+    """
+    by_type = defaultdict(list)
+    for sensor_id, remote_type, remote_id, remote_parameter in sensors:
+        by_type[remote_type].append((sensor_id, remote_id, remote_parameter))
+    fetches = []
+    for remote_type, group in by_type.items():
+        source = remote_gages.get(remote_type)
+        if source is None:
+            logger.error('Unknown remote_type %s for sensors %s',
+                         remote_type, [sensor[0] for sensor in group])
+            continue
+        for url, url_sensors in source.requests_for(group):
+            fetches.append((source, url, url_sensors))
+    return fetches
+
+
+def fetch_remote_samples(due_only=True):
+    """
+    Fetch the latest samples for the remote sensors that are due (or all of
+    them) in one event loop, then save them with one statement. Returns the
+    number of new samples.
+    """
+    if due_only:
+        query = Sensor.remote_due()
+    else:
+        query = Sensor.query.filter(Sensor.local == False)  # noqa
+    sensors = query.with_entities(Sensor.id,
+                                  Sensor.remote_type,
+                                  Sensor.remote_id,
+                                  Sensor.remote_parameter)\
+                   .all()
+    Sensor.lease_polls([sensor[0] for sensor in sensors])
+    db.session.commit()
+    fetches = remote_fetches(sensors)
+    logger.info('Fetching %s remote sensors with %s requests',
+                len(sensors), len(fetches))
+    validators = load_validators(fetch[1] for fetch in fetches)
+    loop = asyncio.new_event_loop()
+    try:
+        results = loop.run_until_complete(fetch_all(
+            [(source, url, url_sensors, validators.get(url))
+             for source, url, url_sensors in fetches]))
+    finally:
+        loop.close()
+    kept, discarded = save_fetch_results(results)
+    logger.info('Saved %s samples and discarded %s', len(kept), len(discarded))
+    return len(kept)
@@ -1,12 +1,115 @@
+from collections import OrderedDict, defaultdict, namedtuple
 import datetime
+from functools import partial
 import logging
+from multiprocessing.pool import ThreadPool
+import threading
+import time
 
-from app.database import db
-from app.models import Sample, Sensor
+from bs4 import BeautifulSoup
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+from app.database import db, add_samples_sql
+from app.models import Sensor
+from .validators import (PROCESSED, NOT_MODIFIED, UNCHANGED, FAILED, OUTCOMES,
+                         Validator, body_digest, conditional_headers,
+                         count_fetches, load_validators, save_validators)
+
+try:
+    import lxml  # noqa
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
 
 logger = logging.getLogger(__name__)
 
 
+# why add_new_samples discarded a sample
+TOO_SOON = 'too soon'
+DUPLICATE = 'duplicate'
+
+SampleResult = namedtuple('SampleResult', 'sensor_id datetime value id reason')
+
+# bytes read at a time when streaming the tail of a body
+BODY_CHUNK = 8 * 1024
+
+
+def trim_tail(buf, size):
+    """
+    Drop all but the last size bytes of the bytearray buf once it holds
+    twice that, so a streamed body can be read while keeping its tail
+    """
+    if len(buf) >= 2 * size:
+        del buf[:-size]
+
+
+def read_tail(chunks, size):
+    """
+    Return the last size bytes of an iterable of byte chunks, without
+    holding more than about twice that at once
+    """
+    buf = bytearray()
+    for chunk in chunks:
+        buf += chunk
+        trim_tail(buf, size)
+    return bytes(buf[-size:])
+
+
+def make_soup(text, parse_only=None):
+    """
+    Return a BeautifulSoup of the html text, built with lxml when it is
+    installed. parse_only may be a ``bs4.SoupStrainer`` to skip building the
+    parts of the page that aren't needed.
+    """
+    return BeautifulSoup(text, HTML_PARSER, parse_only=parse_only)
+
+
+def add_new_samples(samples, deltaminutes=10):
+    """
+    Adds a batch of samples for remote sensors with one statement in
+    PostgreSQL. Samples are discarded if their sensor's latest sample was
+    recorded within the last deltaminutes (TOO_SOON), or if the sensor
+    already has a sample at that datetime, including earlier in the batch
+    (DUPLICATE).
+    Arguments:
+        samples (list): (sensor id, datetime, value) tuples
+        deltaminutes (int): Minutes to wait after the latest sample, or 0
+                            to only discard duplicates
+
+    Returns a (kept, discarded) tuple of lists of ``SampleResult``, which
+    have the new sample id for those that were kept or the reason for those
+    that were discarded.
+    """
+    if not samples:
+        return [], []
+    if deltaminutes:
+        cutoff = datetime.datetime.now() - datetime.timedelta(minutes=deltaminutes)
+    else:
+        cutoff = datetime.datetime.max
+    rows = db.session.execute(add_samples_sql, {
+        'sensor_ids': [sample[0] for sample in samples],
+        'datetimes': [sample[1] for sample in samples],
+        'values': [sample[2] for sample in samples],
+        'cutoff': cutoff
+    }).fetchall()
+    kept, discarded = [], []
+    for sample, row in zip(samples, rows):
+        result = SampleResult(sample[0], sample[1], sample[2], row.id, row.reason)
+        if row.reason is None:
+            kept.append(result)
+        else:
+            discarded.append(result)
+            logger.info('Discarded sample (%s - %s) for sensor %s: %s',
+                        result.value, result.datetime, result.sensor_id,
+                        result.reason)
+    Sensor.samples_added([result.id for result in kept])
+    db.session.commit()
+    logger.debug('Saved %s samples and discarded %s', len(kept), len(discarded))
+    return kept, discarded
+
+
 def add_new_sample(sensor_id, dt, svalue, deltaminutes=10):
     """
     Adds a new sample with an associacted remote sensor
@@ -16,58 +119,371 @@ def add_new_sample(sensor_id, dt, svalue, deltaminutes=10):
         sensor_id (int): Primary key for sensor
         dt (datetime): Datetime of sample
         svalue (float): Value of sample
+
+    Returns a ``SampleResult``.
     """
-    delta = datetime.datetime.now() - datetime.timedelta(minutes=deltaminutes)
-    sample = Sample.query.filter_by(sensor_id=sensor_id)\
-                         .order_by(Sample.datetime.desc()).first()
-    if sample is None or (sample.datetime < delta and
-                          (sample.datetime != dt.replace(tzinfo=None))):
-        new_sample = Sample(sensor_id=sensor_id,
-                            value=svalue,
-                            datetime=dt)
-        db.session.add(new_sample)
-        db.session.commit()
-        logger.debug('Saved sample (%s - %s - %s) for sensor %s',
-                     new_sample.id,
-                     svalue,
-                     dt,
-                     sensor_id)
-    else:
-        message = ''
-        if sample.datetime == dt.replace(tzinfo=None):
-            message = message + 'Sample times are the same. '
-        if sample.datetime < delta:
-            message = message + 'Last sample was more than {0} min ago '.format(deltaminutes)
-        else:
-            message = message + 'Last sample was less than {0} min ago '.format(deltaminutes)
-        logger.warning('Discarded sample (%s - %s) for sensor %s, compared to (%s - %s). %s',
-                       svalue,
-                       dt,
-                       sensor_id,
-                       sample.value,
-                       sample.datetime,
-                       message)
+    kept, discarded = add_new_samples([(sensor_id, dt, svalue)], deltaminutes)
+    return (kept + discarded)[0]
+
+
+FetchResult = namedtuple('FetchResult',
+                         'source url outcome validator samples sensor_ids')
+
+
+def save_fetch_results(results):
+    """
+    Save the samples from a list of ``FetchResult``, schedule when their
+    sensors are next fetched, store the validators of the URLs that were
+    fetched and count the outcomes, all in one transaction.
+
+    A URL's validator is only stored if every sample from it was kept or
+    was already saved. If any were discarded as too soon the validator is
+    left as it was, so the next fetch parses the body again instead of
+    skipping it as unchanged.
+    """
+    kept, discarded = add_new_samples(
+        [sample for result in results for sample in result.samples])
+    updated_ids = set(result.sensor_id for result in kept)
+    polled_ids = set(sensor_id for result in results
+                     for sensor_id in result.sensor_ids)
+    Sensor.schedule_polls(updated_ids, polled_ids - updated_ids)
+    too_soon = set((result.sensor_id, result.datetime) for result in discarded
+                   if result.reason == TOO_SOON)
+    save_validators(dict((result.url, result.validator) for result in results
+                         if result.outcome != FAILED and
+                         not any((sample[0], sample[1]) in too_soon
+                                 for sample in result.samples)))
+    by_source = defaultdict(list)
+    for result in results:
+        by_source[result.source].append(result.outcome)
+    for source, outcomes in by_source.items():
+        count_fetches(source, outcomes)
+        logger.info('%s fetches: %s', source,
+                    ', '.join('{0} {1}'.format(outcomes.count(outcome), outcome)
+                              for outcome in OUTCOMES))
+    db.session.commit()
+    return kept, discarded
+
+
+class RateLimiter(object):
+    """
+    Spaces out calls to wait() from any number of threads so that they
+    return at least interval seconds apart.
+    """
+    def __init__(self, interval):
+        self.interval = interval
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """
+        Block until the next call is allowed
+        """
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
 
 
 class RemoteGage(object):
     """
     Base abstraction of the gage updating process
+
+    Each source keeps one pooled keep-alive ``requests.Session`` that is
+    shared by its instances. Sources implement ``url`` and ``parse`` (or
+    ``requests_for`` and ``parse_samples`` when one document covers several
+    sensors), which never touch the database, so that
+    ``get_multiple_samples`` can fetch a chunk of sensors concurrently in a
+    pool of WORKERS threads, or ``app.remote.aio`` in an event loop, and the
+    results are saved afterwards from the calling thread. Requests are
+    conditional on the validators from the last fetch of each URL, and
+    bodies are only parsed when they have changed.
+
+    ``backfill`` fills the gaps since each sensor's latest sample from
+    ``history_requests`` and ``parse_history``, which default to the latest
+    sample for sources that don't publish their history.
     """
+    # (connect, read) timeouts in seconds
+    TIMEOUT = (5, 30)
+    # sent with every request from requests_for
+    HEADERS = {}
+    # if set, only the last TAIL_BYTES of each response body are kept, for
+    # sources that ask for the end of a file with a Range header. A server
+    # that ignores the Range sends the whole file, which is streamed.
+    TAIL_BYTES = None
+    RETRIES = 3
+    BACKOFF = 0.5
+    WORKERS = 8
+    # backfill threads, and the least seconds between their requests
+    BACKFILL_WORKERS = 4
+    BACKFILL_INTERVAL = 0.5
+    # days to backfill for sensors without any samples
+    BACKFILL_DAYS = 7
+    # samples to save per statement when backfilling
+    BACKFILL_BATCH = 5000
+
+    _session_lock = threading.Lock()
+
+    @classmethod
+    def session(cls):
+        """
+        Return the ``requests.Session`` for this source, creating it with
+        connection pooling and retries on the first call
+        """
+        session = cls.__dict__.get('_session')
+        if session is None:
+            with cls._session_lock:
+                session = cls.__dict__.get('_session')
+                if session is None:
+                    retry = Retry(total=cls.RETRIES,
+                                  backoff_factor=cls.BACKOFF,
+                                  status_forcelist=(500, 502, 503, 504))
+                    adapter = HTTPAdapter(pool_connections=cls.WORKERS,
+                                          pool_maxsize=cls.WORKERS,
+                                          max_retries=retry)
+                    session = requests.Session()
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    cls._session = session
+        return session
+
+    @classmethod
+    def fetch(cls, url, **kwargs):
+        """
+        GET url with the source's session and timeouts and return the
+        ``requests.Response``. Raises ``requests.HTTPError`` for error
+        responses.
+        """
+        kwargs.setdefault('timeout', cls.TIMEOUT)
+        response = cls.session().get(url, **kwargs)
+        response.raise_for_status()
+        return response
+
     def sensor(self, sensor_id):
         """
         Returns selected sensor object
         """
         return Sensor.query.get(sensor_id)
 
+    def url(self, remote_id, remote_parameter=None):
+        """
+        Return the URL with the latest sample for a remote site
+        """
+        raise NotImplementedError
+
+    def parse(self, text, remote_id, remote_parameter=None):
+        """
+        Return the latest (datetime, value) for a remote site from the text
+        of its url()
+        """
+        raise NotImplementedError
+
+    def remote_sample(self, remote_id, remote_parameter=None):
+        """
+        Download and return the latest (datetime, value) for a remote site.
+        Doesn't use the database, so it may be called from worker threads.
+        """
+        text = self.fetch(self.url(remote_id, remote_parameter)).text
+        return self.parse(text, remote_id, remote_parameter)
+
+    def requests_for(self, sensors):
+        """
+        Return (url, sensors) pairs that cover all of sensors, which are
+        (id, remote_id, remote_parameter) tuples. Each url is fetched once
+        and its text is given to parse_samples with its sensors, so sensors
+        that share a url, like the level and discharge of a station, only
+        cost one request.
+        """
+        by_url = OrderedDict()
+        for sensor in sensors:
+            by_url.setdefault(self.url(sensor[1], sensor[2]), []).append(sensor)
+        return list(by_url.items())
+
+    def parse_samples(self, text, sensors):
+        """
+        Return (sensor id, datetime, value) for each of sensors, as given by
+        requests_for, from the text of their url
+        """
+        return [(sensor_id,) + self.parse(text, remote_id, remote_parameter)
+                for sensor_id, remote_id, remote_parameter in sensors]
+
     def get_sample(self, sensor_id):
         """
         Get a single sample and save latest values
         """
-        raise NotImplementedError
+        sensor = self.sensor(sensor_id)
+        dt, v = self.remote_sample(sensor.remote_id, sensor.remote_parameter)
+        add_new_sample(sensor.id, dt, v)
+
+    def request_headers(self, validator):
+        """
+        Return the headers for a request from requests_for, which is
+        conditional on validator
+        """
+        headers = dict(self.HEADERS)
+        headers.update(conditional_headers(validator))
+        return headers
+
+    def handle_response(self, url, sensors, validator, status, headers,
+                        content, encoding):
+        """
+        Return a ``FetchResult`` for the response to a conditional request
+        for url, only parsing the body if it has changed since validator.
+        """
+        source = type(self).__name__
+        sensor_ids = [sensor[0] for sensor in sensors]
+        if status == 304:
+            return FetchResult(source, url, NOT_MODIFIED, validator, [],
+                               sensor_ids)
+        digest = body_digest(content)
+        fresh = Validator(headers.get('ETag'), headers.get('Last-Modified'),
+                          digest)
+        if validator is not None and validator.digest == digest:
+            return FetchResult(source, url, UNCHANGED, fresh, [], sensor_ids)
+        text = content.decode(encoding or 'utf-8', 'replace')
+        return FetchResult(source, url, PROCESSED, fresh,
+                           self.parse_samples(text, sensors), sensor_ids)
+
+    def _fetch_samples(self, request):
+        """
+        Fetch and parse a (url, sensors, validator) tuple, returning a
+        ``FetchResult``
+        """
+        url, sensors, validator = request
+        try:
+            headers = self.request_headers(validator)
+            if self.TAIL_BYTES is None:
+                response = self.fetch(url, headers=headers)
+                content = response.content
+                encoding = response.encoding or response.apparent_encoding
+            else:
+                response = self.fetch(url, headers=headers, stream=True)
+                try:
+                    content = read_tail(response.iter_content(BODY_CHUNK),
+                                        self.TAIL_BYTES)
+                finally:
+                    response.close()
+                encoding = response.encoding
+            return self.handle_response(
+                url, sensors, validator, response.status_code,
+                response.headers, content, encoding)
+        except Exception:
+            sensor_ids = [sensor[0] for sensor in sensors]
+            logger.exception('Unable to fetch samples for sensors %s from %s',
+                             sensor_ids, url)
+            return FetchResult(type(self).__name__, url, FAILED, None, [],
+                               sensor_ids)
 
     def get_multiple_samples(self, sensor_ids):
         """
         Smartly get multiple samples if possible and save latest values
         """
-        for sensor_id in sensor_ids:
-            self.get_sample(sensor_id)
+        sensors = Sensor.query.filter(Sensor.id.in_(sensor_ids))\
+                              .with_entities(Sensor.id,
+                                             Sensor.remote_id,
+                                             Sensor.remote_parameter)\
+                              .all()
+        fetches = self.requests_for(sensors)
+        if not fetches:
+            return
+        validators = load_validators(url for url, url_sensors in fetches)
+        pool = ThreadPool(min(self.WORKERS, len(fetches)))
+        try:
+            results = pool.map(self._fetch_samples,
+                               [(url, url_sensors, validators.get(url))
+                                for url, url_sensors in fetches])
+        finally:
+            pool.close()
+            pool.join()
+        save_fetch_results(results)
+
+    def history_url(self, remote_id, remote_parameter=None, since=None):
+        """
+        Return the URL with the samples for a remote site since a datetime
+        """
+        return self.url(remote_id, remote_parameter)
+
+    def history_requests(self, sensors):
+        """
+        Return (url, sensors) pairs that cover all of sensors, which are
+        (id, remote_id, remote_parameter, since) tuples, for backfilling.
+        """
+        by_url = OrderedDict()
+        for sensor in sensors:
+            url = self.history_url(sensor[1], sensor[2], sensor[3])
+            by_url.setdefault(url, []).append(sensor)
+        return list(by_url.items())
+
+    def parse_history(self, response, sensors):
+        """
+        Return (sensor id, datetime, value) for every sample of sensors, as
+        given by history_requests, in the streamed ``requests.Response`` of
+        their url
+        """
+        return self.parse_samples(response.text,
+                                  [sensor[:3] for sensor in sensors])
+
+    def _fetch_history(self, limiter, request):
+        """
+        Fetch and parse a (url, sensors) pair from history_requests once
+        limiter allows, returning the samples
+        """
+        url, sensors = request
+        limiter.wait()
+        try:
+            response = self.fetch(url, stream=True)
+            return self.parse_history(response, sensors)
+        except Exception:
+            logger.exception('Unable to backfill sensors %s from %s',
+                             [sensor[0] for sensor in sensors], url)
+            return []
+
+    def backfill_sensors(self, sensor_ids, since=None):
+        """
+        Return (id, remote_id, remote_parameter, since) for sensor_ids, where
+        since is given, or the sensor's last sample datetime, or
+        BACKFILL_DAYS ago.
+        """
+        default = datetime.datetime.now() - datetime.timedelta(days=self.BACKFILL_DAYS)
+        sensors = Sensor.query.filter(Sensor.id.in_(sensor_ids))\
+                              .with_entities(Sensor.id,
+                                             Sensor.remote_id,
+                                             Sensor.remote_parameter,
+                                             Sensor.last)\
+                              .all()
+        return [(sensor_id, remote_id, remote_parameter,
+                 since or last or default)
+                for sensor_id, remote_id, remote_parameter, last in sensors]
+
+    def backfill(self, sensor_ids, since=None):
+        """
+        Fetch and save every sample of sensor_ids since their latest sample,
+        or since if given. BACKFILL_WORKERS threads fetch at most one URL
+        every BACKFILL_INTERVAL seconds, and their samples are saved in
+        batches as they finish, skipping duplicates.
+
+        Returns the number of (kept, discarded) samples.
+        """
+        fetches = self.history_requests(self.backfill_sensors(sensor_ids, since))
+        if not fetches:
+            return 0, 0
+        kept = discarded = 0
+        pool = ThreadPool(min(self.BACKFILL_WORKERS, len(fetches)))
+        try:
+            fetch = partial(self._fetch_history,
+                            RateLimiter(self.BACKFILL_INTERVAL))
+            for samples in pool.imap_unordered(fetch, fetches):
+                for start in range(0, len(samples), self.BACKFILL_BATCH):
+                    batch_kept, batch_discarded = add_new_samples(
+                        samples[start:start + self.BACKFILL_BATCH],
+                        deltaminutes=0)
+                    kept += len(batch_kept)
+                    discarded += len(batch_discarded)
+        finally:
+            pool.close()
+            pool.join()
+        logger.info('%s backfill saved %s samples and discarded %s',
+                    type(self).__name__, kept, discarded)
+        return kept, discarded
@@ -7,43 +7,117 @@ The Cheticamp River (http://wateroffice.ec.gc.ca/report/report_e.html?type=realT
 would be NS_01FC002
 If discharge is prefered set the remote_parameter to discharge
 """
+from collections import deque
 import csv
 
 import arrow
-import requests
+import pytz
 
-from .base import RemoteGage, add_new_sample
+from .base import RemoteGage
 
 
 class WaterOffice(RemoteGage):
     """
     BC_07EA004
+
+    Only the end of each hydrometric CSV is requested with a Range header,
+    as the latest row is all that is needed. Servers that ignore the Range
+    send the whole file, which is streamed while only keeping the last
+    TAIL_BYTES (or the last row, for ``get_from_wateroffice``).
     """
-    @staticmethod
-    def get_from_wateroffice(remote_id):
+    URLBASE = 'http://dd.weather.gc.ca/hydrometric/csv/{}/hourly/{}_hourly_hydrometric.csv'
+    # the last 30 days, for backfilling
+    DAILY_URLBASE = 'http://dd.weather.gc.ca/hydrometric/csv/{}/daily/{}_daily_hydrometric.csv'
+    # enough for about a day of 5 minute rows
+    TAIL_BYTES = 32 * 1024
+    HEADERS = {'Range': 'bytes=-{0}'.format(TAIL_BYTES)}
+
+    def url(self, remote_id, remote_parameter=None):
         province = remote_id.split('_')[0]
-        url = 'http://dd.weather.gc.ca/hydrometric/csv/{}/hourly/{}_hourly_hydrometric.csv'.format(province, remote_id)
-        response = requests.get(url)
-        riter = response.iter_lines(decode_unicode=True)
-        next(riter)
-        reader = csv.reader(riter)
-        lines = []
-        for row in reader:
-            lines.append(row)
-        last = lines[-1]
-        level = float(last[2])
+        return self.URLBASE.format(province, remote_id)
+
+    @staticmethod
+    def csv_rows(lines):
+        """
+        Return a csv reader over the lines of a hydrometric CSV, skipping the
+        first line which is either the header, or a partial row when only
+        the end of the file was requested
+        """
+        riter = iter(lines)
+        next(riter, None)
+        return csv.reader(riter)
+
+    @staticmethod
+    def parse_row(row):
+        """
+        Return datetime, level, and discharge (or None) from a row
+        """
+        level = float(row[2])
         try:
-            discharge = float(last[6])
+            discharge = float(row[6])
         except ValueError:
             discharge = None
-        dt = arrow.get(last[1]).datetime
+        dt = arrow.get(row[1]).datetime
 
         return dt, level, discharge
 
-    def get_sample(self, sensor_id):
-        sensor = self.sensor(sensor_id)
-        dt, level, discharge = self.get_from_wateroffice(sensor.remote_id)
-        if sensor.remote_parameter == 'discharge':
-            add_new_sample(sensor.id, dt, discharge)
-        else:
-            add_new_sample(sensor.id, dt, level)
+    @classmethod
+    def latest(cls, lines):
+        """
+        Return datetime, level, and discharge (or None) from the last row of
+        the lines of a hydrometric CSV
+        """
+        last = deque(cls.csv_rows(lines), maxlen=1)
+        return cls.parse_row(last[-1])
+
+    def get_from_wateroffice(self, remote_id):
+        response = self.fetch(self.url(remote_id), headers=self.HEADERS,
+                              stream=True)
+        return self.latest(response.iter_lines(decode_unicode=True))
+
+    def history_url(self, remote_id, remote_parameter=None, since=None):
+        province = remote_id.split('_')[0]
+        return self.DAILY_URLBASE.format(province, remote_id)
+
+    @classmethod
+    def rows_since(cls, lines, since=None):
+        """
+        Yield the datetime, level, and discharge (or None) of every row in
+        the lines of a hydrometric CSV that is newer than since, a naive
+        UTC datetime like the samples are stored with
+        """
+        for row in cls.csv_rows(lines):
+            dt, level, discharge = cls.parse_row(row)
+            utc = dt.astimezone(pytz.utc).replace(tzinfo=None)
+            if since is None or utc > since:
+                yield dt, level, discharge
+
+    def parse(self, text, remote_id, remote_parameter=None):
+        dt, level, discharge = self.latest(text.splitlines())
+        if remote_parameter == 'discharge':
+            return dt, discharge
+        return dt, level
+
+    def parse_samples(self, text, sensors):
+        """
+        Parse the latest row of a station once for all of its sensors
+        """
+        dt, level, discharge = self.latest(text.splitlines())
+        return [(sensor_id, dt,
+                 discharge if remote_parameter == 'discharge' else level)
+                for sensor_id, remote_id, remote_parameter in sensors]
+
+    def parse_history(self, response, sensors):
+        """
+        Stream the rows of a station's daily file newer than the earliest of
+        its sensors' since, and fan them out to each sensor
+        """
+        since = min(sensor[3] for sensor in sensors)
+        lines = response.iter_lines(decode_unicode=True)
+        samples = []
+        for dt, level, discharge in self.rows_since(lines, since):
+            for sensor_id, remote_id, remote_parameter, _ in sensors:
+                value = discharge if remote_parameter == 'discharge' else level
+                if value is not None:
+                    samples.append((sensor_id, dt, value))
+        return samples
@@ -4,10 +4,9 @@ Sensor.remote_id is the Numero de la station e.g.: 050915 for the Nelson (http:/
 """
 import datetime
 import logging
-import requests
 
 from app.models import Sensor
-from .base import add_new_sample, RemoteGage
+from .base import RemoteGage
 
 logger = logging.getLogger(__name__)
 
@@ -20,23 +19,37 @@ def digit_or_period(c):
 class CEHQ(RemoteGage):
     URLBASE = 'http://www.cehq.gouv.qc.ca/suivihydro/fichier_donnees.asp'
 
+    def url(self, remote_id, remote_parameter=None):
+        return (self.URLBASE +
+                '?NoStation=' + str(remote_id))
+
     def response(self, site_num):
         """
         Retrieve a requests.Response object for the plain text representation
         of a Quebec CEHQ gage
         """
-        url = (self.URLBASE +
-               '?NoStation=' + str(site_num))
-        return requests.get(url)
+        return self.fetch(self.url(site_num))
 
-    def recent_flow(self, site_num):
-        r = self.response(site_num)
-        line = r.text.splitlines()[2]
+    @staticmethod
+    def flow(text):
+        """
+        Return the most recent flow from the plain text of a station
+        """
+        line = text.splitlines()[2]
         number = line.split('\t')[2].replace(',', '.')
         return float(''.join(list(filter(digit_or_period, number))))
 
-    def get_sample(self, sensor_id):
-        sensor = self.sensor(sensor_id)
-        v = self.recent_flow(sensor.remote_id)
+    def recent_flow(self, site_num):
+        return self.flow(self.response(site_num).text)
+
+    def parse(self, text, remote_id, remote_parameter=None):
+        v = self.flow(text)
         dt = datetime.datetime.now()
-        add_new_sample(sensor.id, dt, v)
+        return dt, v
+
+    def parse_samples(self, text, sensors):
+        """
+        Parse the flow of a station once for all of its sensors
+        """
+        dt, v = self.parse(text, None)
+        return [(sensor[0], dt, v) for sensor in sensors]
@@ -6,10 +6,12 @@ For Canaserga Creek (http://rivergages.mvr.usace.army.mil/WaterControl/shefdata2
 the remote_id is DSVN6
 """
 import arrow
-from bs4 import BeautifulSoup
-import requests
+from bs4 import SoupStrainer
 
-from .base import add_new_sample, RemoteGage
+from .base import RemoteGage, make_soup
+
+# only the form with the table of daily values is built
+DAILY_FORM = SoupStrainer('form', attrs={'name': 'frm_daily'})
 
 
 class Corps(RemoteGage):
@@ -18,29 +20,39 @@ class Corps(RemoteGage):
     """
     URLBASE = 'http://rivergages.mvr.usace.army.mil/WaterControl/shefdata2.cfm'
 
+    def url(self, remote_id, remote_parameter=None):
+        return self.URLBASE + '?sid={}&d=1&dt=S'.format(remote_id)
+
     def soup(self, remote_id):
         """
         Return a beautiful soup object from rivergages.mvr.usace.army.mil
         """
-        url = self.URLBASE + '?sid={}&d=1&dt=S'.format(remote_id)
-        r = requests.get(url)
-        return BeautifulSoup(r.text, 'html.parser')
+        r = self.fetch(self.url(remote_id))
+        return make_soup(r.text, parse_only=DAILY_FORM)
 
-    def dt_value(self, remote_id):
+    def dt_value(self, remote_id, soup=None):
         """
         Return the most recent datetime and value
         """
-        form = self.soup(remote_id).find('form', {'name': 'frm_daily'})
+        if soup is None:
+            soup = self.soup(remote_id)
+        form = soup.find('form', {'name': 'frm_daily'})
         table = form.findChild('table')
         children = table.findChildren('tr')[5].findChildren('td')
         dt = arrow.get(children[0].text, 'MM/DD/YYYY HH:mm').datetime
         value = float(children[1].text)
         return dt, value
 
-    def get_sample(self, sensor_id):
+    def parse(self, text, remote_id, remote_parameter=None):
+        """
+        Takes a Corps page, returns the latest sample
+        """
+        return self.dt_value(remote_id,
+                             soup=make_soup(text, parse_only=DAILY_FORM))
+
+    def parse_samples(self, text, sensors):
         """
-        Takes a sensor id, tries to get the latest sample from the Corps
+        Parse a Corps page once for all of its sensors
         """
-        sensor = self.sensor(sensor_id)
-        dt, v = self.dt_value(sensor.remote_id)
-        add_new_sample(sensor.id, dt, v)
+        dt, value = self.parse(text, None)
+        return [(sensor[0], dt, value) for sensor in sensors]
@@ -2,28 +2,36 @@
 Get flows (and other parameters) from h2oline.com sites
 """
 import datetime
+from functools import lru_cache
 import logging
 import re
 
-from bs4 import BeautifulSoup
-import requests
 import parsedatetime
 
 from app.models import Sensor
-from .base import add_new_sample, RemoteGage
+from .base import RemoteGage, make_soup
 
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=32)
+def value_pattern(parameter):
+    """
+    Return the compiled pattern for a number followed by parameter
+    """
+    return re.compile(r'([\d.]+)+(?= {})'.format(re.escape(parameter)))
+
+
 class H2Oline(RemoteGage):
-    @staticmethod
-    def soup(remote_id):
+    URLBASE = 'http://www.h2oline.com/default.aspx?pg=si&op={}'
+
+    @classmethod
+    def soup(cls, remote_id):
         """
         Return a beautiful soup object from h2oline
         """
-        url = 'http://www.h2oline.com/default.aspx?pg=si&op={}'.format(remote_id)
-        r = requests.get(url)
-        return BeautifulSoup(r.text, 'html.parser')
+        r = cls.fetch(cls.URLBASE.format(remote_id))
+        return make_soup(r.text)
 
     def river(self, remote_id, soup=None):
         """
@@ -40,16 +48,14 @@ class H2Oline(RemoteGage):
         """
         if soup is None:
             soup = self.soup(remote_id)
-        p = re.compile('([\d.]+)+(?= {})'.format(parameter))
-        return soup.body.findAll(text=p)
+        return soup.body.findAll(text=value_pattern(parameter))
 
     @staticmethod
     def start_end(string, parameter):
         """
         Return the start and end of the parameter in the string
         """
-        p = re.compile('([\d.]+)+(?= {})'.format(parameter))
-        result = p.search(string)
+        result = value_pattern(parameter).search(string)
         return result.start(), result.end()
 
     def value(self, remote_id, parameter='CFS', soup=None):
@@ -76,14 +82,23 @@ class H2Oline(RemoteGage):
         dt = datetime.datetime.now()
         return dt, float(strings[0][start:end])
 
-    def get_sample(self, sensor_id):
+    def url(self, remote_id, remote_parameter=None):
+        return self.URLBASE.format(remote_id)
+
+    def parse(self, text, remote_id, remote_parameter=None):
         """
-        Takes a sensor id, tries to get the latest sample from the site
+        Takes a site page, returns the latest sample of the parameter
         """
-        sensor = self.sensor(sensor_id)
-        if sensor.remote_parameter is None:
-            dt, v = self.dt_value(sensor.remote_id)
-        else:
-            dt, v = self.dt_value(sensor.remote_id,
-                                  parameter=sensor.remote_parameter)
-        add_new_sample(sensor.id, dt, v)
+        return self.dt_value(remote_id,
+                             parameter=remote_parameter or 'CFS',
+                             soup=make_soup(text))
+
+    def parse_samples(self, text, sensors):
+        """
+        Parse a site page once for the parameters of all of its sensors
+        """
+        soup = make_soup(text)
+        return [(sensor_id,) + self.dt_value(remote_id,
+                                             parameter=remote_parameter or 'CFS',
+                                             soup=soup)
+                for sensor_id, remote_id, remote_parameter in sensors]
@@ -1,18 +1,24 @@
 """
 Retrieving samples from the USGS Instantaneous Values service
 """
-import requests
+from collections import OrderedDict
+import datetime
+import json
+import logging
+
 import arrow
 from flask import current_app
 
-from app.models import Sensor
-from .base import add_new_sample, RemoteGage
+from .base import RemoteGage
 
-URLBASE = 'http://waterservices.usgs.gov/nwis/iv/?format=json,1.1'
+logger = logging.getLogger(__name__)
 
 
 class USGS(RemoteGage):
     URLBASE = 'http://waterservices.usgs.gov/nwis/iv/?format=json,1.1'
+    SITES_PER_REQUEST = 100
+    # the longest period the Instantaneous Values service returns
+    MAX_BACKFILL_DAYS = 120
 
     @staticmethod
     def site_code(site_json):
@@ -33,30 +39,104 @@ class USGS(RemoteGage):
         v = float(value['value'])
         return dt, v
 
-    def get_sample(self, sensor_id):
-        """
-        Takes a sensor id, tries to ge thte latest sample from the site
-        """
-        sensor = self.sensor(sensor_id)
-        parameter = (sensor.remote_parameter or '00065')
-        url = (self.URLBASE +
-               '&sites=' + sensor.remote_id +
-               '&parameterCD=' + parameter)
-        site = requests.get(url).json()['value']['timeSeries'][0]
-        dt, v = self.dt_value(site)
-        add_new_sample(sensor.id, dt, v)
-
-    def get_multiple_samples(self, sensor_ids):
-        parameter = (self.sensor(sensor_ids[0]).remote_parameter or '00065')
-        remote_sensors = Sensor.query.filter(Sensor.id.in_(sensor_ids))\
-                                     .with_entities(Sensor.remote_id)\
-                                     .all()
-        remote_ids = [sensor[0] for sensor in remote_sensors]
-        url = (URLBASE + '&sites=' + ','.join(remote_ids) +
-               '&parameterCD=' + str(parameter))
-        r = requests.get(url).json()
-        for site in r['value']['timeSeries']:
-            sc = self.site_code(site)
-            dt, v = self.dt_value(site)
-            sensor = Sensor.query.filter(Sensor.remote_id == sc).first()
-            add_new_sample(sensor.id, dt, v)
+    def url(self, remote_id, remote_parameter=None):
+        """
+        Return the Instantaneous Values URL for one or more comma separated
+        site codes
+        """
+        return (self.URLBASE +
+                '&sites=' + remote_id +
+                '&parameterCD=' + str(remote_parameter or '00065'))
+
+    def parse(self, text, remote_id, remote_parameter=None):
+        """
+        Takes the response for a site code, returns the latest sample
+        """
+        return self.dt_value(json.loads(text)['value']['timeSeries'][0])
+
+    def requests_for(self, sensors):
+        """
+        Request up to SITES_PER_REQUEST sites with the same parameter at once
+        """
+        by_parameter = OrderedDict()
+        for sensor in sensors:
+            by_parameter.setdefault(sensor[2] or '00065', []).append(sensor)
+        fetches = []
+        for parameter, group in by_parameter.items():
+            for start in range(0, len(group), self.SITES_PER_REQUEST):
+                chunk = group[start:start + self.SITES_PER_REQUEST]
+                remote_ids = ','.join(sensor[1] for sensor in chunk)
+                fetches.append((self.url(remote_ids, parameter), chunk))
+        return fetches
+
+    def parse_samples(self, text, sensors):
+        """
+        Match each time series in a multiple site response to its sensors,
+        skipping sites without a latest value or whose latest value is the
+        series' no data value, so the rest of the response is still saved
+        """
+        sensor_ids = {}
+        for sensor in sensors:
+            sensor_ids.setdefault(sensor[1], []).append(sensor[0])
+        samples = []
+        for site in json.loads(text)['value']['timeSeries']:
+            try:
+                code = self.site_code(site)
+                dt, v = self.dt_value(site)
+            except (IndexError, KeyError, ValueError):
+                logger.warning('No latest value in USGS time series %s',
+                               site.get('name'))
+                continue
+            if v == site.get('variable', {}).get('noDataValue'):
+                continue
+            for sensor_id in sensor_ids.get(code, []):
+                samples.append((sensor_id, dt, v))
+        return samples
+
+    def history_url(self, remote_id, remote_parameter=None, since=None):
+        """
+        Return the Instantaneous Values URL for every sample of one or more
+        comma separated site codes since a datetime, as a period in hours
+        """
+        hours = (datetime.datetime.now() - since).total_seconds() // 3600 + 2
+        hours = min(int(hours), self.MAX_BACKFILL_DAYS * 24)
+        return (self.url(remote_id, remote_parameter) +
+                '&period=PT{0}H'.format(hours))
+
+    def history_requests(self, sensors):
+        """
+        Request up to SITES_PER_REQUEST sites with the same parameter at
+        once, since the earliest of them
+        """
+        by_parameter = OrderedDict()
+        for sensor in sensors:
+            by_parameter.setdefault(sensor[2] or '00065', []).append(sensor)
+        fetches = []
+        for parameter, group in by_parameter.items():
+            for start in range(0, len(group), self.SITES_PER_REQUEST):
+                chunk = group[start:start + self.SITES_PER_REQUEST]
+                remote_ids = ','.join(sensor[1] for sensor in chunk)
+                since = min(sensor[3] for sensor in chunk)
+                fetches.append((self.history_url(remote_ids, parameter, since),
+                                chunk))
+        return fetches
+
+    def parse_history(self, response, sensors):
+        """
+        Return every value of each time series in a multiple site response
+        for its sensors, skipping the series' no data values
+        """
+        sensor_ids = {}
+        for sensor in sensors:
+            sensor_ids.setdefault(sensor[1], []).append(sensor[0])
+        samples = []
+        for site in response.json()['value']['timeSeries']:
+            ids = sensor_ids.get(self.site_code(site), [])
+            no_data = site.get('variable', {}).get('noDataValue')
+            for value in site['values'][0]['value']:
+                v = float(value['value'])
+                if v == no_data:
+                    continue
+                dt = arrow.get(value['dateTime']).datetime
+                samples.extend((sensor_id, dt, v) for sensor_id in ids)
+        return samples
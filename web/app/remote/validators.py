@@ -0,0 +1,110 @@
+"""
+Conditional GET state and fetch metrics for remote sources
+
+The ETag, Last-Modified and a hash of the body of each remote URL are kept
+in the ``remote_validators`` table so that the next fetch can send a
+conditional request, and skip parsing when the server answers 304 or sends
+the same body again. Counts of each fetch outcome per source are kept in
+``remote_fetch_counts``. Both are in the database rather than the cache, so
+every worker sees them whatever cache backend is configured.
+"""
+from collections import namedtuple
+import datetime
+import hashlib
+
+from flask import current_app
+
+from app.database import db, count_fetches_sql, save_validators_sql
+from app.models import RemoteFetchCount, RemoteValidator
+
+Validator = namedtuple('Validator', 'etag last_modified digest')
+
+# outcomes of fetching a remote URL
+PROCESSED = 'processed'
+NOT_MODIFIED = 'not modified'
+UNCHANGED = 'unchanged'
+FAILED = 'failed'
+OUTCOMES = (PROCESSED, NOT_MODIFIED, UNCHANGED, FAILED)
+
+
+def body_digest(content):
+    """
+    Return the hash of a response body that is stored with its validator
+    """
+    return hashlib.sha1(content).hexdigest()
+
+
+def conditional_headers(validator):
+    """
+    Return the request headers that make a GET conditional on validator
+    """
+    headers = {}
+    if validator is not None:
+        if validator.etag:
+            headers['If-None-Match'] = validator.etag
+        if validator.last_modified:
+            headers['If-Modified-Since'] = validator.last_modified
+    return headers
+
+
+def load_validators(urls):
+    """
+    Return a dict of the stored ``Validator`` for each of urls that has one
+    stored within REMOTE_VALIDATOR_TIMEOUT seconds
+    """
+    urls = list(urls)
+    if not urls:
+        return {}
+    since = datetime.datetime.utcnow() - datetime.timedelta(
+        seconds=current_app.config['REMOTE_VALIDATOR_TIMEOUT'])
+    rows = db.session.query(RemoteValidator.url,
+                            RemoteValidator.etag,
+                            RemoteValidator.last_modified,
+                            RemoteValidator.digest)\
+                     .filter(RemoteValidator.url.in_(urls))\
+                     .filter(RemoteValidator.updated >= since)
+    return dict((row.url, Validator(*row[1:])) for row in rows)
+
+
+def save_validators(validators):
+    """
+    Store a dict of url to ``Validator`` for the next fetch, in the
+    session's transaction
+    """
+    if validators:
+        urls = list(validators)
+        db.session.execute(save_validators_sql, {
+            'urls': urls,
+            'etags': [validators[url].etag for url in urls],
+            'last_modifieds': [validators[url].last_modified for url in urls],
+            'digests': [validators[url].digest for url in urls],
+            'updated': datetime.datetime.utcnow()
+        })
+
+
+def count_fetches(source, outcomes):
+    """
+    Add a list of fetch outcomes to the counts for source, in the session's
+    transaction
+    """
+    counted = [outcome for outcome in OUTCOMES if outcome in outcomes]
+    if counted:
+        db.session.execute(count_fetches_sql, {
+            'source': source,
+            'outcomes': counted,
+            'counts': [outcomes.count(outcome) for outcome in counted]
+        })
+
+
+def fetch_metrics(sources):
+    """
+    Return {source: {outcome: count}} for each of the source names
+    """
+    metrics = dict((source, dict((outcome, 0) for outcome in OUTCOMES))
+                   for source in sources)
+    counts = RemoteFetchCount.query\
+                             .filter(RemoteFetchCount.source.in_(list(metrics)))
+    for count in counts:
+        if count.outcome in metrics[count.source]:
+            metrics[count.source][count.outcome] = count.count
+    return metrics
@@ -1,36 +1,27 @@
 """
 Celery tasks for fetching remote samples
 """
+import datetime
 import logging
 
 from celery.task.schedules import crontab
 from celery.decorators import periodic_task
+from flask import current_app
 from sqlalchemy import func
 
+from app.cache import invalidate_geojson
 from app.database import db
 from app.models import Sensor
-from app.remote import h2oline, usgs, cehq, cawateroffice, corps, base
+from app.remote import remote_gages
 from app.celery import celery
 
 logger = logging.getLogger(__name__)
 
 SAMPLES_PER_CHUNK = 25
 
-H2Oline = h2oline.H2Oline()
-USGS = usgs.USGS()
-CEHQ = cehq.CEHQ()
-CAWaterOffice = cawateroffice.WaterOffice()
-CORPS = corps.Corps()
-Failure = base.RemoteGage()
 
-
-sources = {
-    'h2oline': H2Oline.get_multiple_samples,
-    'usgs': USGS.get_multiple_samples,
-    'cehq': CEHQ.get_multiple_samples,
-    'cawater': CAWaterOffice.get_multiple_samples,
-    'corps': CORPS.get_multiple_samples
-}
+sources = dict((remote_type, source.get_multiple_samples)
+               for remote_type, source in remote_gages.items())
 
 
 class UnknownSource(Exception):
@@ -59,7 +50,10 @@ def fetch_samples(sensor_ids, remote_type, remote_parameter):
     and remote_parameter
     """
     logger.info('Fetching a chunk of %s samples for sensors %s', remote_type, sensor_ids)
-    sources.get(remote_type, missing_multiple_samples)(sensor_ids)
+    try:
+        sources.get(remote_type, missing_multiple_samples)(sensor_ids)
+    finally:
+        invalidate_geojson()
 
 
 def chunk_sensor_ids(sensor_ids, remote_type, remote_parameter, delay):
@@ -80,20 +74,75 @@ def chunk_sensor_ids(sensor_ids, remote_type, remote_parameter, delay):
             fetch_samples(chunk, remote_type, remote_parameter)
 
 
-@periodic_task(run_every=(crontab(minute='*/15')),
+@periodic_task(run_every=(crontab(minute='*')),
                name='fetch_remote_samples',
                ignore_result=True)
-def fetch_remote_samples(delay=True):
+def fetch_remote_samples(delay=True, due_only=True):
     """
-    Create tasks for all remote sensors to be updated
+    Create tasks for the remote sensors that are due to be updated (or all
+    of them), or fetch them all here with the asyncio engine if
+    REMOTE_FETCH_ENGINE is async. Each sensor's next fetch is scheduled
+    from its own update interval once it has been fetched.
     """
-    # Fetch remote USGS level gages
+    if current_app.config['REMOTE_FETCH_ENGINE'] == 'async':
+        from app.remote import aio
+        try:
+            aio.fetch_remote_samples(due_only)
+        finally:
+            invalidate_geojson()
+        return
     logger.info('Fetching remote samples')
-    remote_sensors = db.session.query(func.array_Agg(Sensor.id),
-                                      Sensor.remote_type,
-                                      Sensor.remote_parameter)\
-                               .group_by(Sensor.remote_type,
+    if due_only:
+        query = Sensor.remote_due()
+    else:
+        query = Sensor.query.filter(Sensor.local == False)  # noqa
+    remote_sensors = query.with_entities(func.array_Agg(Sensor.id),
+                                         Sensor.remote_type,
                                          Sensor.remote_parameter)\
-                               .filter(Sensor.local == False).all()
+                          .group_by(Sensor.remote_type,
+                                    Sensor.remote_parameter)\
+                          .all()
+    Sensor.lease_polls([sensor_id for group in remote_sensors
+                        for sensor_id in group[0]])
+    db.session.commit()
     for group in remote_sensors:
         chunk_sensor_ids(group[0], group[1], group[2], delay)
+
+
+@celery.task
+def backfill_samples(remote_type, sensor_ids, days=None):
+    """
+    Backfill every sample since the latest for sensor_ids of a remote_type,
+    or for the last days if given. Returns the number of (kept, discarded)
+    samples.
+    """
+    since = None
+    if days:
+        since = datetime.datetime.now() - datetime.timedelta(days=days)
+    logger.info('Backfilling %s sensors %s', remote_type, sensor_ids)
+    try:
+        return remote_gages[remote_type].backfill(sensor_ids, since)
+    finally:
+        invalidate_geojson()
+
+
+def backfill_remote_samples(days=None, remote_type=None, delay=True):
+    """
+    Create a backfill task for each remote source (or only remote_type), so
+    that sources fill in parallel while each keeps to its own rate limit
+    """
+    remote_sensors = db.session.query(func.array_agg(Sensor.id),
+                                      Sensor.remote_type)\
+                               .group_by(Sensor.remote_type)\
+                               .filter(Sensor.local == False)
+    if remote_type is not None:
+        remote_sensors = remote_sensors.filter(Sensor.remote_type == remote_type)
+    for sensor_ids, group_type in remote_sensors.all():
+        if group_type not in remote_gages:
+            logger.warning('Unable to backfill unknown remote_type %s for sensors %s',
+                           group_type, sensor_ids)
+            continue
+        if delay:
+            backfill_samples.delay(group_type, sensor_ids, days)
+        else:
+            backfill_samples(group_type, sensor_ids, days)
@@ -0,0 +1,48 @@
+"""
+The ?start=YYYYMMDD&end=YYYYMMDD time range arguments that are shared by
+plots and API endpoints which return samples over time.
+"""
+import datetime
+
+from flask import request
+
+from .exceptions import ValidationError
+
+DATE_FORMAT = '%Y%m%d'
+
+
+def parse_date(value, name):
+    """
+    Return a datetime from a YYYYMMDD string, or None if value is empty.
+    Raises ValidationError naming the argument if it isn't a valid date.
+    """
+    if not value:
+        return None
+    try:
+        return datetime.datetime.strptime(value, DATE_FORMAT)
+    except ValueError:
+        raise ValidationError('{0} should be a date formatted as YYYYMMDD'.format(name))
+
+
+def startend():
+    """
+    Return datetime objects if start and end arguments are in url.
+    Otherwise return None.
+    """
+    return (parse_date(request.args.get('start'), 'start'),
+            parse_date(request.args.get('end'), 'end'))
+
+
+def filter_range(query, column, start=None, end=None, include_start=True):
+    """
+    Limit query to rows where start <= column < end, skipping either side
+    that is None. With include_start False, rows at start are left out too.
+    """
+    if start is not None:
+        if include_start:
+            query = query.filter(column >= start)
+        else:
+            query = query.filter(column > start)
+    if end is not None:
+        query = query.filter(column < end)
+    return query
@@ -0,0 +1,59 @@
+"""
+External URLs for JSON serializers, built from a per-request template for
+each endpoint instead of a full ``url_for`` route lookup for every object.
+"""
+from flask import g, url_for
+from werkzeug.urls import url_quote
+
+# stand-in values that url_for builds into the template, and which are then
+# swapped for format fields
+INT_PLACEHOLDER = 918273645
+STRING_PLACEHOLDER = 'xurltemplate{0}x'
+
+
+def url_template(endpoint, values):
+    """
+    Return a str.format template of the external URL for endpoint with
+    format fields for the rule arguments in values.
+
+    Arguments:
+        endpoint (str): Endpoint name as given to ``url_for``
+        values (dict): Example rule arguments, used to pick int or string
+                       placeholders
+    """
+    placeholders = {}
+    for index, name in enumerate(sorted(values)):
+        if isinstance(values[name], int):
+            placeholders[name] = INT_PLACEHOLDER + index
+        else:
+            placeholders[name] = STRING_PLACEHOLDER.format(index)
+    url = url_for(endpoint, _external=True, **placeholders)
+    url = url.replace('{', '{{').replace('}', '}}')
+    for name, placeholder in placeholders.items():
+        url = url.replace(str(placeholder), '{' + name + '}')
+    return url
+
+
+def external_url(endpoint, **values):
+    """
+    Return the external URL for endpoint like
+    ``url_for(endpoint, _external=True, **values)``. values must be
+    arguments of the endpoint's URL rule.
+
+    Templates are cached on ``g`` so they follow the host of each request.
+    Raises ValueError if any of values are None, such as the id of an
+    object that hasn't been saved.
+    """
+    for name, value in values.items():
+        if value is None:
+            raise ValueError('No {0} to build a URL for {1}'.format(name, endpoint))
+    templates = getattr(g, '_url_templates', None)
+    if templates is None:
+        templates = g._url_templates = {}
+    key = (endpoint,) + tuple(sorted(values))
+    template = templates.get(key)
+    if template is None:
+        template = templates[key] = url_template(endpoint, values)
+    return template.format(**dict(
+        (name, str(value) if isinstance(value, int) else url_quote(value))
+        for name, value in values.items()))
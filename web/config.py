@@ -1,4 +1,5 @@
 import os
+import tempfile
 basedir = os.path.abspath(os.path.dirname(__file__))
 
 
@@ -23,6 +24,36 @@ class Config:
     CELERYD_MAX_TASKS_PER_CHILD = 10
     CELERYD_TASK_TIME_LIMIT = 600
     API_GAGES_PER_PAGE = 100
+    CACHE_TYPE = os.environ.get('CACHE_TYPE', 'simple')
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', CELERY_BROKER_URL)
+    CACHE_KEY_PREFIX = 'gage-web:'
+    GEOJSON_CACHE_TIMEOUT = 300
+    PLOT_CACHE_TYPE = os.environ.get('PLOT_CACHE_TYPE', 'filesystem')
+    PLOT_CACHE_DIR = os.environ.get('PLOT_CACHE_DIR',
+        os.path.join(tempfile.gettempdir(), 'gage-web-plots'))
+    PLOT_CACHE_THRESHOLD = 500
+    PLOT_CACHE_TIMEOUT = 900
+    PLOT_MAX_AGE = 300
+    # plots are around 600px wide, so a min and max per pixel
+    PLOT_MAX_POINTS = 1200
+    # orjson, stdlib, or auto to use orjson when it is installed. orjson
+    # only encodes when JSON_AS_ASCII is False, as it can't escape non-ASCII,
+    # which production and docker set to send UTF-8 like JSON defaults to
+    JSON_ENCODER = os.environ.get('JSON_ENCODER', 'auto')
+    # http for RFC 1123 dates like Flask has always sent, or iso for ISO 8601
+    JSON_DATETIME_FORMAT = os.environ.get('JSON_DATETIME_FORMAT', 'http')
+    # celery to fan chunks of sensors out to workers, or async to fetch
+    # them all in one event loop
+    REMOTE_FETCH_ENGINE = os.environ.get('REMOTE_FETCH_ENGINE', 'celery')
+    # seconds to keep the ETag, Last-Modified and body hash of remote URLs
+    REMOTE_VALIDATOR_TIMEOUT = 24 * 60 * 60
+    # seconds between fetches of a remote sensor: assumed until an interval
+    # is learned from its last REMOTE_POLL_HISTORY samples, and the shortest
+    # and longest waits
+    REMOTE_POLL_DEFAULT = 15 * 60
+    REMOTE_POLL_MIN = 5 * 60
+    REMOTE_POLL_MAX = 6 * 60 * 60
+    REMOTE_POLL_HISTORY = 12
 
     @staticmethod
     def init_app(app):
@@ -43,6 +74,7 @@ class TestingConfig(Config):
     CSRF_ENABLED = False
     SQLALCHEMY_DATABASE_URI = os.environ.get('GAGE_DB', 'postgresql://localhost/gage_web_testing')
     CELERY_ALWAYS_EAGER = True
+    PLOT_CACHE_TYPE = 'simple'
     # SQLALCHEMY_ECHO = True
 
 
@@ -56,7 +88,8 @@ class DockerConfig(Config):
     SQLALCHEMY_DATABASE_URI = (
         os.environ.get('GAGE_DB') or
         'postgresql://localhost/gage-web')
-    
+    JSONIFY_PRETTYPRINT_REGULAR = False
+    JSON_AS_ASCII = False
 
 
 class ProductionConfig(Config):
@@ -68,6 +101,8 @@ class ProductionConfig(Config):
     SQLALCHEMY_DATABASE_URI = (
         os.environ.get('GAGE_DB') or
         'postgresql://localhost/gage-web')
+    JSONIFY_PRETTYPRINT_REGULAR = False
+    JSON_AS_ASCII = False
 
 config = {
     'development': DevelopmentConfig,
@@ -82,6 +82,98 @@ def test(coverage=False):
         COV.erase()
 
 
+@manager.option('-n', '--count', dest='count', type=int, default=20,
+                help='Number of plots to render')
+@manager.option('-s', '--sensor', dest='sensor_id', type=int, default=None,
+                help='Sensor to plot, defaults to the first with samples')
+def benchmark_plots(count, sensor_id):
+    """
+    Render a sensor plot repeatedly and report latency and memory growth
+    """
+    import resource
+    import time
+    from app.main.plot import SensorPlot
+
+    if sensor_id is None:
+        sensor = Sensor.query.filter(Sensor.latest_sample_id.isnot(None))\
+                             .first()
+    else:
+        sensor = Sensor.query.get(sensor_id)
+    if sensor is None:
+        print('No sensor to plot')
+        return
+
+    def max_rss():
+        # kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    timings = []
+    with app.test_request_context():
+        plot = SensorPlot(sensor.gage_id, sensor.stype)
+        plot.png()  # warm up imports and font caches
+        rss_start = max_rss()
+        for _ in range(count):
+            start = time.time()
+            plot.png()
+            timings.append(time.time() - start)
+        rss_end = max_rss()
+    timings.sort()
+    print('Rendered {0} plots of {1}'.format(count, sensor))
+    print('Per plot: mean {0:.1f} ms, median {1:.1f} ms, max {2:.1f} ms'.format(
+        1000 * sum(timings) / len(timings),
+        1000 * timings[len(timings) // 2],
+        1000 * timings[-1]))
+    print('Max RSS growth: {0} KB ({1} KB to {2} KB)'.format(
+        rss_end - rss_start, rss_start, rss_end))
+
+
+@manager.option('--async', dest='use_async', action='store_true',
+                help='Fetch every sensor in one asyncio event loop')
+@manager.option('--due', dest='due_only', action='store_true',
+                help='Only fetch sensors that are due by their schedule')
+def fetch_remote(use_async=False, due_only=False):
+    """
+    Fetch the latest samples for all remote sensors
+    """
+    from app.cache import invalidate_geojson
+    if use_async:
+        from app.remote import aio
+        print('Saved {0} new samples'.format(aio.fetch_remote_samples(due_only)))
+    else:
+        from app.tasks.remote import fetch_remote_samples
+        fetch_remote_samples(delay=False, due_only=due_only)
+    invalidate_geojson()
+
+
+@manager.option('-d', '--days', dest='days', type=float, default=None,
+                help='Backfill the last days instead of since the latest samples')
+@manager.option('-t', '--type', dest='remote_type', default=None,
+                help='Only backfill sensors with this remote_type')
+@manager.option('--queue', dest='queue', action='store_true',
+                help='Queue a Celery task for each source instead of waiting')
+def backfill_remote(days=None, remote_type=None, queue=False):
+    """
+    Fill the gaps in remote sensors since their latest samples
+    """
+    from app.tasks.remote import backfill_remote_samples
+    backfill_remote_samples(days=days, remote_type=remote_type, delay=queue)
+
+
+@manager.command
+def remote_metrics():
+    """
+    Show how many remote fetches were processed or skipped for each source
+    """
+    from app.remote import remote_gages
+    from app.remote.validators import OUTCOMES, fetch_metrics
+    sources = sorted(type(source).__name__ for source in remote_gages.values())
+    print('{0:15s}'.format('source') +
+          ''.join('{0:>15s}'.format(outcome) for outcome in OUTCOMES))
+    for source, counts in sorted(fetch_metrics(sources).items()):
+        print('{0:15s}'.format(source) +
+              ''.join('{0:>15d}'.format(counts[outcome]) for outcome in OUTCOMES))
+
+
 @manager.command
 def backup():
     """
@@ -0,0 +1,37 @@
+"""Latest sample on sensors
+
+Revision ID: 5e2c0a7d9f31
+Revises: 88c36aab1133
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5e2c0a7d9f31'
+down_revision = '88c36aab1133'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('sensors', sa.Column('latest_sample_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('fk_sensors_latest_sample_id', 'sensors', 'samples',
+                          ['latest_sample_id'], ['id'], ondelete='SET NULL')
+    # backfill from existing samples
+    op.execute("""
+        UPDATE sensors
+        SET latest_sample_id = latest.id,
+            last = latest.datetime
+        FROM (
+            SELECT DISTINCT ON (sensor_id) id, sensor_id, datetime
+            FROM samples
+            ORDER BY sensor_id, datetime DESC, id DESC
+        ) latest
+        WHERE sensors.id = latest.sensor_id
+    """)
+
+
+def downgrade():
+    op.drop_constraint('fk_sensors_latest_sample_id', 'sensors', type_='foreignkey')
+    op.drop_column('sensors', 'latest_sample_id')
@@ -0,0 +1,45 @@
+"""Sample rollups
+
+Revision ID: 9a4d61c2b8e7
+Revises: 5e2c0a7d9f31
+Create Date: 2026-10-18 11:40:02.512377
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9a4d61c2b8e7'
+down_revision = '5e2c0a7d9f31'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('sample_rollups',
+    sa.Column('sensor_id', sa.Integer(), nullable=False),
+    sa.Column('period', sa.String(length=8), nullable=False),
+    sa.Column('start', sa.DateTime(), nullable=False),
+    sa.Column('minimum', sa.Float(), nullable=True),
+    sa.Column('maximum', sa.Float(), nullable=True),
+    sa.Column('total', sa.Float(), nullable=True),
+    sa.Column('count', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['sensor_id'], ['sensors.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('sensor_id', 'period', 'start')
+    )
+    # backfill from existing samples
+    op.execute("""
+        INSERT INTO sample_rollups
+            (sensor_id, period, start, minimum, maximum, total, count)
+        SELECT sensor_id, period, date_trunc(period, datetime),
+               min(value), max(value), sum(value), count(value)
+        FROM samples
+        CROSS JOIN unnest(ARRAY['hour', 'day']) period
+        WHERE sensor_id IS NOT NULL
+        AND datetime IS NOT NULL
+        AND value IS NOT NULL
+        GROUP BY sensor_id, period, date_trunc(period, datetime)
+    """)
+
+
+def downgrade():
+    op.drop_table('sample_rollups')
@@ -0,0 +1,23 @@
+"""Sensor samples version
+
+Revision ID: a4e6b2d81c37
+Revises: f2c8d4a61e90
+Create Date: 2026-10-18 21:04:17.336102
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'a4e6b2d81c37'
+down_revision = 'f2c8d4a61e90'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('sensors', sa.Column('samples_version', sa.Integer(),
+                                       nullable=False, server_default='0'))
+
+
+def downgrade():
+    op.drop_column('sensors', 'samples_version')
@@ -0,0 +1,24 @@
+"""Sample keyset indexes
+
+Revision ID: b71f3c0e4d52
+Revises: 9a4d61c2b8e7
+Create Date: 2026-10-18 13:05:41.206733
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b71f3c0e4d52'
+down_revision = '9a4d61c2b8e7'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_index('ix_samples_datetime_id', 'samples', ['datetime', 'id'], unique=False)
+    op.create_index('ix_samples_sensor_id_datetime_id', 'samples', ['sensor_id', 'datetime', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_samples_sensor_id_datetime_id', table_name='samples')
+    op.drop_index('ix_samples_datetime_id', table_name='samples')
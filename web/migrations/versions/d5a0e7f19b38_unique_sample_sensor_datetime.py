@@ -0,0 +1,70 @@
+"""Unique sample sensor and datetime
+
+Revision ID: d5a0e7f19b38
+Revises: b71f3c0e4d52
+Create Date: 2026-10-18 14:10:27.581944
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'd5a0e7f19b38'
+down_revision = 'b71f3c0e4d52'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    # keep the first of any samples that share a sensor and datetime
+    op.execute("""
+        CREATE TEMPORARY TABLE duplicated_sensors AS
+        SELECT DISTINCT later.sensor_id
+        FROM samples later
+        JOIN samples earlier
+        ON earlier.sensor_id = later.sensor_id
+        AND earlier.datetime = later.datetime
+        AND earlier.id < later.id
+    """)
+    op.execute("""
+        DELETE FROM samples later
+        USING samples earlier
+        WHERE earlier.sensor_id = later.sensor_id
+        AND earlier.datetime = later.datetime
+        AND earlier.id < later.id
+    """)
+    # deleting a latest sample sets sensors.latest_sample_id to NULL
+    op.execute("""
+        UPDATE sensors
+        SET latest_sample_id = latest.id,
+            last = latest.datetime
+        FROM (
+            SELECT DISTINCT ON (sensor_id) id, sensor_id, datetime
+            FROM samples
+            WHERE sensor_id IN (SELECT sensor_id FROM duplicated_sensors)
+            ORDER BY sensor_id, datetime DESC, id DESC
+        ) latest
+        WHERE sensors.id = latest.sensor_id
+        AND sensors.latest_sample_id IS NULL
+    """)
+    op.execute("""
+        DELETE FROM sample_rollups
+        WHERE sensor_id IN (SELECT sensor_id FROM duplicated_sensors)
+    """)
+    op.execute("""
+        INSERT INTO sample_rollups
+            (sensor_id, period, start, minimum, maximum, total, count)
+        SELECT sensor_id, period, date_trunc(period, datetime),
+               min(value), max(value), sum(value), count(value)
+        FROM samples
+        CROSS JOIN unnest(ARRAY['hour', 'day']) period
+        WHERE sensor_id IN (SELECT sensor_id FROM duplicated_sensors)
+        AND datetime IS NOT NULL
+        AND value IS NOT NULL
+        GROUP BY sensor_id, period, date_trunc(period, datetime)
+    """)
+    op.execute('DROP TABLE duplicated_sensors')
+    op.create_unique_constraint('uq_samples_sensor_id_datetime', 'samples', ['sensor_id', 'datetime'])
+
+
+def downgrade():
+    op.drop_constraint('uq_samples_sensor_id_datetime', 'samples', type_='unique')
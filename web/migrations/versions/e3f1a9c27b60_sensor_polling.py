@@ -0,0 +1,27 @@
+"""Sensor polling schedule
+
+Revision ID: e3f1a9c27b60
+Revises: d5a0e7f19b38
+Create Date: 2026-10-18 16:02:51.204417
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'e3f1a9c27b60'
+down_revision = 'd5a0e7f19b38'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('sensors', sa.Column('poll_interval', sa.Integer(), nullable=True))
+    op.add_column('sensors', sa.Column('next_poll', sa.DateTime(), nullable=True))
+    op.add_column('sensors', sa.Column('poll_misses', sa.Integer(), nullable=False,
+                                       server_default='0'))
+
+
+def downgrade():
+    op.drop_column('sensors', 'poll_misses')
+    op.drop_column('sensors', 'next_poll')
+    op.drop_column('sensors', 'poll_interval')
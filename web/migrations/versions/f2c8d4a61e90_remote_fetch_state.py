@@ -0,0 +1,40 @@
+"""Remote validators and fetch counts
+
+Revision ID: f2c8d4a61e90
+Revises: e3f1a9c27b60
+Create Date: 2026-10-18 19:12:40.583921
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'f2c8d4a61e90'
+down_revision = 'e3f1a9c27b60'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('remote_validators',
+    sa.Column('url', sa.Text(), nullable=False),
+    sa.Column('etag', sa.Text(), nullable=True),
+    sa.Column('last_modified', sa.Text(), nullable=True),
+    sa.Column('digest', sa.Text(), nullable=True),
+    sa.Column('updated', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('url')
+    )
+    op.create_index(op.f('ix_remote_validators_updated'), 'remote_validators',
+                    ['updated'], unique=False)
+    op.create_table('remote_fetch_counts',
+    sa.Column('source', sa.String(length=80), nullable=False),
+    sa.Column('outcome', sa.String(length=20), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('source', 'outcome')
+    )
+
+
+def downgrade():
+    op.drop_table('remote_fetch_counts')
+    op.drop_index(op.f('ix_remote_validators_updated'),
+                  table_name='remote_validators')
+    op.drop_table('remote_validators')
@@ -1,6 +1,22 @@
+import datetime
+import json
+import unittest
+from unittest import mock
+import zlib
+
 import vcr
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+from itsdangerous import JSONWebSignatureSerializer
+from sqlalchemy import event, inspect
 
 from .test_basics import BasicTestCase
+from app.api_0_1 import exports
+from app.database import db
+from app.models import Gage, Region, Sensor, Sample
 
 
 class APITestCase(BasicTestCase):
@@ -17,10 +33,132 @@ class APITestCase(BasicTestCase):
         rv = self.client.get('/api/0.1/gages/')
         assert 'Wild River' in str(rv.data)
 
+    def test_api_gage_geojson(self):
+        rv = self.client.get('/api/0.1/gages/map/')
+        result = json.loads(rv.data.decode('utf-8'))
+        assert result['type'] == 'FeatureCollection'
+        feature = result['features'][0]
+        assert feature['properties']['name'] == 'Wild River at Gilead'
+        assert round(feature['geometry']['coordinates'][0], 4) == -70.9796
+        assert round(feature['geometry']['coordinates'][1], 4) == 44.3908
+        sensor = feature['properties']['sensors'][0]
+        assert sensor['recent_sample']['value'] == 5.8
+        assert feature['properties']['regions'] == []
+
+    def count_geojson_queries(self):
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        db.session.expire_all()
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            with self.app.test_request_context('/'):
+                collection = Gage.geojson_collection()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+        return len(collection['features']), len(statements)
+
+    def test_api_gage_geojson_queries(self):
+        assert self.count_geojson_queries()[0] == 1
+        one = self.count_geojson_queries()[1]
+        region = Region.query.first()
+        for n in range(5):
+            gage = Gage(name='Gage {0}'.format(n), slug='gage-{0}'.format(n),
+                        point='SRID=4326;POINT(-70.{0} 44.{0})'.format(n + 1),
+                        regions=[region])
+            sensor = Sensor(gage=gage, stype='level', local=True)
+            sample = Sample(sensor=sensor, value=float(n),
+                            datetime=datetime.datetime(2017, 6, 3, 12, n))
+            sensor.latest_sample = sample
+            db.session.add_all([gage, sensor, sample])
+        db.session.commit()
+        features, many = self.count_geojson_queries()
+        assert features == 6
+        assert many == one
+
+    def test_api_gage_geojson_cached(self):
+        rv = self.client.get('/api/0.1/gages/map/')
+        etag = rv.headers['ETag']
+        rv = self.client.get('/api/0.1/gages/map/',
+                             headers={'If-None-Match': etag})
+        assert rv.status_code == 304
+        rv = self.client.get('/api/0.1/gages/map/',
+                             headers={'Accept-Encoding': 'gzip'})
+        assert rv.headers['Content-Encoding'] == 'gzip'
+        data = zlib.decompress(rv.data, 16 + zlib.MAX_WBITS)
+        assert 'Wild River' in data.decode('utf-8')
+
+    def test_api_gage_geojson_per_host(self):
+        for base_url in ('http://riverflo.ws/', 'https://www.riverflo.ws/',
+                         'http://riverflo.ws/'):
+            rv = self.client.get('/api/0.1/gages/map/', base_url=base_url)
+            feature = json.loads(rv.data.decode('utf-8'))['features'][0]
+            assert feature['properties']['html'].startswith(base_url)
+
     def test_api_gage(self):
         rv = self.client.get('/api/0.1/gages/1')
         assert 'Wild River' in str(rv.data)
 
+    def test_api_gage_new_samples(self):
+        s = JSONWebSignatureSerializer('password')
+        dt = str(datetime.datetime.now())
+        payload = {'samples': [{'type': 'level', 'value': 4.2,
+                                'datetime': dt, 'sender_id': 7},
+                               {'type': 'Volts', 'value': 12.1,
+                                'datetime': dt, 'sender_id': 8},
+                               {'type': 'usgs-height', 'value': 5.9,
+                                'datetime': dt, 'sender_id': 9}],
+                   'gage': {'id': 1}}
+        sensors_before = Sensor.query.count()
+        samples_before = Sample.query.count()
+        rv = self.client.post('/api/0.1/gages/1/sample', data=s.dumps(payload))
+        assert rv.status_code == 200
+        result = json.loads(rv.data.decode('utf-8'))
+        assert result['result'] == 'created'
+        assert result['gage']['id'] == 1
+        assert result['gage']['name'] == Gage.query.get(1).name
+        assert result['gage']['url'].endswith('/api/0.1/gages/1')
+        assert [sample['sender_id'] for sample in result['samples']] == [7, 8, 9]
+        assert [sample['value'] for sample in result['samples']] == [4.2, 12.1, 5.9]
+        assert Sensor.query.count() == sensors_before + 2
+        assert Sample.query.count() == samples_before + 3
+
+    def test_api_gage_new_samples_resent(self):
+        s = JSONWebSignatureSerializer('password')
+        payload = {'samples': [{'type': 'usgs-height', 'value': 4.0,
+                                'datetime': '2017-06-03T12:15:00Z',
+                                'sender_id': 1},
+                               {'type': 'usgs-height', 'value': 5.0,
+                                'datetime': '2017-06-03T12:15:00+00:00',
+                                'sender_id': 2}],
+                   'gage': {'id': 1}}
+        rv = self.client.post('/api/0.1/gages/1/sample', data=s.dumps(payload))
+        assert rv.status_code == 200
+        result = json.loads(rv.data.decode('utf-8'))
+        assert [sample['value'] for sample in result['samples']] == [5.0, 5.0]
+        payload['samples'] = [{'type': 'usgs-height', 'value': 7.0,
+                               'datetime': '2017-06-03 12:15:00',
+                               'sender_id': 3}]
+        rv = self.client.post('/api/0.1/gages/1/sample', data=s.dumps(payload))
+        assert rv.status_code == 200
+        assert Sample.query.filter_by(
+            sensor_id=1, datetime=datetime.datetime(2017, 6, 3, 12, 15)
+        ).one().value == 7.0
+        rv = self.client.get('/api/0.1/sensors/1/aggregate'
+                             '?bucket=1h&start=20170603&end=20170604')
+        buckets = json.loads(rv.data.decode('utf-8'))['buckets']
+        assert len(buckets) == 1
+        assert buckets[0]['count'] == 1
+        assert buckets[0]['maximum'] == 7.0
+
+    def test_api_gage_new_samples_bad_signature(self):
+        s = JSONWebSignatureSerializer('not-the-password')
+        rv = self.client.post('/api/0.1/gages/1/sample',
+                              data=s.dumps({'samples': [], 'gage': {'id': 1}}))
+        assert rv.status_code == 401
+
     def test_api_regions(self):
         rv = self.client.get('/api/0.1/regions/')
         assert 'Maine' in str(rv.data)
@@ -58,6 +196,178 @@ class APITestCase(BasicTestCase):
         rv = self.client.get('/api/0.1/sensors/1')
         assert 'Wild River' in str(rv.data)
 
+    def test_api_sensor_aggregate(self):
+        rv = self.client.get('/api/0.1/sensors/1/aggregate?bucket=15m')
+        result = json.loads(rv.data.decode('utf-8'))
+        assert result['bucket'] == '15m'
+        assert len(result['buckets']) == 1
+        assert result['buckets'][0]['count'] == 1
+        assert result['buckets'][0]['mean'] == 5.8
+
+    def test_api_sensor_aggregate_rollups(self):
+        s = JSONWebSignatureSerializer('password')
+        dt = datetime.datetime(2017, 6, 3, 12, 15)
+        payload = {'samples': [{'type': 'usgs-height', 'value': value,
+                                'datetime': str(dt + datetime.timedelta(minutes=15 * i)),
+                                'sender_id': i}
+                               for i, value in enumerate([4.0, 5.0, 6.0, 3.0])],
+                   'gage': {'id': 1}}
+        self.client.post('/api/0.1/gages/1/sample', data=s.dumps(payload))
+        rv = self.client.get('/api/0.1/sensors/1/aggregate'
+                             '?bucket=1h&start=20170603&end=20170604')
+        buckets = json.loads(rv.data.decode('utf-8'))['buckets']
+        assert [bucket['count'] for bucket in buckets] == [3, 1]
+        assert buckets[0]['minimum'] == 4.0
+        assert buckets[0]['maximum'] == 6.0
+        assert buckets[0]['mean'] == 5.0
+        rv = self.client.get('/api/0.1/sensors/1/aggregate'
+                             '?bucket=1d&start=20170603&end=20170604')
+        buckets = json.loads(rv.data.decode('utf-8'))['buckets']
+        assert len(buckets) == 1
+        assert buckets[0]['count'] == 4
+        assert buckets[0]['maximum'] == 6.0
+
+    def test_api_sensor_aggregate_rollups_rebuilt(self):
+        s = JSONWebSignatureSerializer('password')
+        dt = datetime.datetime(2017, 6, 3, 12, 15)
+        payload = {'samples': [{'type': 'usgs-height', 'value': value,
+                                'datetime': str(dt + datetime.timedelta(minutes=15 * i)),
+                                'sender_id': i}
+                               for i, value in enumerate([4.0, 5.0, 6.0])],
+                   'gage': {'id': 1}}
+        self.client.post('/api/0.1/gages/1/sample', data=s.dumps(payload))
+        edited = Sample.query.filter_by(sensor_id=1, datetime=dt).one()
+        edited.value = 9.0
+        db.session.commit()
+        deleted = Sample.query.filter_by(
+            sensor_id=1, datetime=dt + datetime.timedelta(minutes=30)).one()
+        db.session.delete(deleted)
+        db.session.commit()
+        rv = self.client.get('/api/0.1/sensors/1/aggregate'
+                             '?bucket=1h&start=20170603&end=20170604')
+        buckets = json.loads(rv.data.decode('utf-8'))['buckets']
+        assert len(buckets) == 1
+        assert buckets[0]['count'] == 2
+        assert buckets[0]['minimum'] == 5.0
+        assert buckets[0]['maximum'] == 9.0
+        assert buckets[0]['mean'] == 7.0
+
+    def test_api_sensor_aggregate_orm_inserts(self):
+        dt = datetime.datetime(2017, 6, 3, 12, 15)
+        for i, value in enumerate([4.0, 5.0, 6.0, 3.0, 8.0]):
+            db.session.add(Sample(sensor_id=1, value=value,
+                                  datetime=dt + datetime.timedelta(minutes=20 * i)))
+        db.session.commit()
+        expected = db.session.execute(
+            "SELECT date_trunc('hour', datetime), min(value), max(value), "
+            "avg(value), count(value) FROM samples WHERE sensor_id = 1 "
+            "AND datetime >= '2017-06-03' AND datetime < '2017-06-04' "
+            "GROUP BY 1 ORDER BY 1").fetchall()
+        rv = self.client.get('/api/0.1/sensors/1/aggregate'
+                             '?bucket=1h&start=20170603&end=20170604')
+        buckets = json.loads(rv.data.decode('utf-8'))['buckets']
+        assert [(bucket['minimum'], bucket['maximum'], bucket['mean'],
+                 bucket['count']) for bucket in buckets] == \
+            [tuple(row[1:]) for row in expected]
+        assert len(buckets) == 2
+
+    def test_api_sensor_aggregate_bad_arguments(self):
+        rv = self.client.get('/api/0.1/sensors/1/aggregate?bucket=1y')
+        assert rv.status_code == 400
+        rv = self.client.get('/api/0.1/sensors/1/aggregate?start=June')
+        assert rv.status_code == 400
+
     def test_api_sensor_samples(self):
         rv = self.client.get('/api/0/1/sensors/1/samples')
         assert 'Wild River' in str(rv.data)
+
+    def test_api_sensor_samples_cursor(self):
+        s = JSONWebSignatureSerializer('password')
+        dt = datetime.datetime.now()
+        payload = {'samples': [{'type': 'usgs-height', 'value': 4.2,
+                                'datetime': str(dt), 'sender_id': 1}],
+                   'gage': {'id': 1}}
+        self.client.post('/api/0.1/gages/1/sample', data=s.dumps(payload))
+        rv = self.client.get('/api/0.1/sensors/1/samples?count=exact')
+        result = json.loads(rv.data.decode('utf-8'))
+        assert result['count'] == 2
+        assert result['prev'] is None
+        assert result['samples'][0]['value'] == 5.8
+        rv = self.client.get(result['next'])
+        result = json.loads(rv.data.decode('utf-8'))
+        assert result['samples'][0]['value'] == 4.2
+        assert result['next'] is None
+        rv = self.client.get(result['prev'])
+        result = json.loads(rv.data.decode('utf-8'))
+        assert result['samples'][0]['value'] == 5.8
+        assert result['prev'] is None
+
+    def test_api_samples_bad_cursor(self):
+        rv = self.client.get('/api/0.1/samples/?cursor=nope')
+        assert rv.status_code == 400
+
+    def test_api_sensor_samples_csv(self):
+        rv = self.client.get('/api/0.1/sensors/1/samples.csv')
+        assert rv.mimetype == 'text/csv'
+        lines = rv.data.decode('utf-8').splitlines()
+        assert lines[0] == 'id,datetime,value'
+        assert lines[1].endswith(',5.8')
+        assert len(lines) == 2
+        rv = self.client.get('/api/0.1/sensors/1/samples.csv?end=20000101')
+        assert len(rv.data.decode('utf-8').splitlines()) == 1
+
+    def test_api_sensor_samples_ndjson(self):
+        rv = self.client.get('/api/0.1/sensors/1/samples.ndjson')
+        assert rv.mimetype == 'application/x-ndjson'
+        lines = rv.data.decode('utf-8').splitlines()
+        assert len(lines) == 1
+        assert json.loads(lines[0])['value'] == 5.8
+        sample = Sample.query.get(1)
+        assert json.loads(lines[0])['datetime'] == sample.datetime.isoformat(
+            timespec='microseconds')
+        rv = self.client.get('/api/0.1/sensors/1/samples.ndjson?start=June')
+        assert rv.status_code == 400
+
+    @unittest.skipIf(pa is None, 'pyarrow is not installed')
+    def test_api_sensor_samples_arrow(self):
+        rv = self.client.get('/api/0.1/sensors/1/samples.arrow')
+        table = pa.ipc.open_file(pa.BufferReader(rv.data)).read_all()
+        assert str(table.schema.field('datetime').type) == 'timestamp[us]'
+        assert table.column('value').to_pylist() == [5.8]
+        rv = self.client.get('/api/0.1/samples.parquet?sensors=1,2')
+        assert rv.mimetype == 'application/vnd.apache.parquet'
+        rv = self.client.get('/api/0.1/samples.arrow?sensors=one')
+        assert rv.status_code == 400
+
+    @unittest.skipIf(pa is None, 'pyarrow is not installed')
+    def test_api_sensor_samples_columnar_streamed(self):
+        dt = datetime.datetime(2017, 6, 3, 12, 15)
+        for minutes in (15, 30):
+            db.session.add(Sample(sensor_id=1, value=float(minutes),
+                                  datetime=dt + datetime.timedelta(minutes=minutes)))
+        db.session.commit()
+        with mock.patch.object(exports, 'EXPORT_BATCH', 1):
+            rv = self.client.get('/api/0.1/sensors/1/samples.arrow')
+            assert rv.is_streamed
+            table = pa.ipc.open_file(pa.BufferReader(rv.data)).read_all()
+            assert table.num_rows == 3
+            reader = pa.ipc.open_file(pa.BufferReader(rv.data))
+            assert reader.num_record_batches == 3
+            rv = self.client.get('/api/0.1/sensors/1/samples.parquet')
+            table = pq.read_table(pa.BufferReader(rv.data))
+            assert sorted(table.column('value').to_pylist()) == [5.8, 15.0, 30.0]
+        rv = self.client.get('/api/0.1/sensors/1/samples.parquet?start=June')
+        assert rv.status_code == 400
+
+    def test_api_sensor_samples_fields(self):
+        rv = self.client.get('/api/0.1/sensors/1/samples?fields=value,datetime')
+        sample = json.loads(rv.data.decode('utf-8'))['samples'][0]
+        assert sorted(sample) == ['datetime', 'value']
+        rv = self.client.get('/api/0.1/gages/')
+        gage = json.loads(rv.data.decode('utf-8'))['gages'][0]
+        assert gage['url'] == 'http://localhost/api/0.1/gages/1'
+
+    def test_sample_to_json_skips_unwanted(self):
+        sample = Sample.query.get(1)
+        assert sample.to_json({'id', 'value'}) == {'id': 1, 'value': 5.8}
+        assert 'sensor' in inspect(sample).unloaded
@@ -110,6 +110,7 @@ class BasicTestCase(unittest.TestCase):
                              datetime=dt,
                              value=5.8)
         db.session.add(wild_sample)
+        wild_sensor.latest_sample = wild_sample
         wild_correlation = Correlation(sensor=wild_sensor,
                                        section=wild_section,
                                        minimum=3.5,
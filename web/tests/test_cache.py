@@ -0,0 +1,51 @@
+import time
+import unittest
+
+from app.cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_get_set(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set(1, 'one')
+        assert cache.get(1) == 'one'
+        assert cache.get(2) is None
+        assert cache.get(2, 'default') == 'default'
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set(1, 'one')
+        cache.set(2, 'two')
+        cache.get(1)
+        cache.set(3, 'three')
+        assert cache.get(1) == 'one'
+        assert cache.get(2) is None
+        assert cache.get(3) == 'three'
+        assert len(cache) == 2
+
+    def test_expires(self):
+        cache = LRUCache(maxsize=2, ttl=0.01)
+        cache.set(1, 'one')
+        time.sleep(0.02)
+        assert cache.get(1) is None
+
+    def test_get_or_set(self):
+        cache = LRUCache()
+        calls = []
+
+        def loader(key):
+            calls.append(key)
+            return key * 2 if key else None
+
+        assert cache.get_or_set(2, loader) == 4
+        assert cache.get_or_set(2, loader) == 4
+        assert cache.get_or_set(0, loader) is None
+        assert cache.get_or_set(0, loader) is None
+        assert calls == [2, 0, 0]
+
+    def test_delete(self):
+        cache = LRUCache()
+        cache.set(1, 'one')
+        cache.delete(1)
+        cache.delete(2)
+        assert cache.get(1) is None
@@ -0,0 +1,77 @@
+import datetime
+import json
+import unittest
+
+from flask import Flask, json as flask_json, jsonify as flask_jsonify
+
+from app.encoder import init_json, jsonify, orjson
+from config import config
+
+
+class EncoderTestCase(unittest.TestCase):
+    data = {'name': 'Wild River', 'values': [5.8, 4.2],
+            'datetime': datetime.datetime(2017, 6, 3, 12, 15)}
+
+    def app(self, encoder, datetime_format='http', as_ascii=False):
+        app = Flask(__name__)
+        app.config['JSON_AS_ASCII'] = as_ascii
+        app.config['JSON_ENCODER'] = encoder
+        app.config['JSON_DATETIME_FORMAT'] = datetime_format
+        app.config['JSONIFY_PRETTYPRINT_REGULAR'] = False
+        init_json(app)
+        return app
+
+    def test_stdlib(self):
+        with self.app('stdlib').test_request_context():
+            assert jsonify(self.data).data == flask_jsonify(self.data).data
+
+    @unittest.skipIf(orjson is None, 'orjson is not installed')
+    def test_orjson_matches_stdlib(self):
+        with self.app('orjson').test_request_context():
+            rv = jsonify(self.data)
+            assert rv.mimetype == 'application/json'
+            assert json.loads(rv.data.decode('utf-8')) == \
+                json.loads(flask_jsonify(self.data).data.decode('utf-8'))
+
+    def test_iso_datetimes(self):
+        for encoder in ('stdlib', 'auto'):
+            with self.app(encoder, 'iso').test_request_context():
+                result = json.loads(jsonify(self.data).data.decode('utf-8'))
+                assert result['datetime'] == '2017-06-03T12:15:00'
+
+    def assert_flask_bytes(self, data):
+        rv = jsonify(data)
+        expected = flask_json.dumps(data, separators=(',', ':')) + '\n'
+        assert rv.data == expected.encode('utf-8')
+
+    def test_matches_flask_bytes(self):
+        payloads = [{'name': 'Rivi\u00e8re Rouge \u2014 Saint-Jovite'},
+                    {'values': [5.8, 0.0001, 123456789012345.6, -2.5]},
+                    {'count': 2 ** 70}]
+        for encoder in ('stdlib', 'auto'):
+            for as_ascii in (True, False):
+                with self.app(encoder, as_ascii=as_ascii).test_request_context():
+                    for data in payloads:
+                        self.assert_flask_bytes(data)
+
+    def test_utf8_responses(self):
+        assert config['production'].JSON_AS_ASCII is False
+        assert config['docker'].JSON_AS_ASCII is False
+        data = {'name': 'Rivi\u00e8re Rouge \u2014 Saint-Jovite'}
+        for encoder in ('stdlib', 'auto'):
+            with self.app(encoder).test_request_context():
+                rv = jsonify(data)
+                assert rv.mimetype == 'application/json'
+                assert json.loads(rv.data.decode('utf-8')) == data
+
+    @unittest.skipIf(orjson is None, 'orjson is not installed')
+    def test_orjson_numbers(self):
+        def reject(constant):
+            raise ValueError(constant)
+
+        data = {'values': [1e16, 1.5e-05, -2.5e300, float('nan'),
+                           float('inf')]}
+        with self.app('orjson').test_request_context():
+            result = json.loads(jsonify(data).data.decode('utf-8'),
+                                parse_constant=reject)
+        assert result['values'] == [1e16, 1.5e-05, -2.5e300, None, None]
@@ -67,6 +67,7 @@ class LiveServerBase(LiveServerTestCase):
                              datetime=datetime.datetime.now(),
                              value=5.8)
         db.session.add(wild_sample)
+        wild_sensor.latest_sample = wild_sample
         db.session.commit()
 
         # Create a correlation
@@ -0,0 +1,112 @@
+import datetime
+import unittest
+
+from .test_basics import BasicTestCase
+
+from app.cache import plot_cache
+from app.database import db
+from app.models import Sample, Sensor
+# matplotlib is only installed outside of Travis
+try:
+    from app.main import plot
+except ImportError:
+    plot = None
+
+
+def counting_plot(sensor):
+    """
+    Return a plot of sensor that counts how often it is rendered
+    """
+    class CountingPlot(plot.BasePlot):
+        def __init__(self):
+            self.sensor = sensor
+            self.sid = sensor.id
+            self.renders = 0
+
+        def png(self):
+            self.renders += 1
+            return b'rendered png'
+
+    return CountingPlot()
+
+
+@unittest.skipIf(plot is None, 'matplotlib is not installed')
+class TestPlotResponse(BasicTestCase):
+    def setUp(self):
+        super(TestPlotResponse, self).setUp()
+        plot_cache.clear()
+
+    def test_renders_and_caches(self):
+        sensor = Sensor.query.get(1)
+        first = counting_plot(sensor)
+        with self.app.test_request_context('/'):
+            response = first.response('png')
+        assert response.status_code == 200
+        assert response.get_data() == b'rendered png'
+        assert response.mimetype == 'image/png'
+        assert response.get_etag()[0]
+        assert response.cache_control.public
+        assert first.renders == 1
+
+        second = counting_plot(sensor)
+        with self.app.test_request_context('/'):
+            cached = second.response('png')
+        assert cached.status_code == 200
+        assert cached.get_data() == b'rendered png'
+        assert cached.get_etag() == response.get_etag()
+        assert second.renders == 0
+
+    def test_if_none_match(self):
+        sensor = Sensor.query.get(1)
+        with self.app.test_request_context('/'):
+            etag = counting_plot(sensor).response('png').get_etag()[0]
+
+        conditional = counting_plot(sensor)
+        with self.app.test_request_context(
+                '/', headers={'If-None-Match': '"{0}"'.format(etag)}):
+            response = conditional.response('png')
+        assert response.status_code == 304
+        assert response.get_data() == b''
+        assert conditional.renders == 0
+
+    def test_new_range_misses(self):
+        sensor = Sensor.query.get(1)
+        with self.app.test_request_context('/'):
+            etag = counting_plot(sensor).response('png').get_etag()[0]
+
+        ranged = counting_plot(sensor)
+        with self.app.test_request_context(
+                '/?start=20150101&end=20150201',
+                headers={'If-None-Match': '"{0}"'.format(etag)}):
+            response = ranged.response('png')
+        assert response.status_code == 200
+        assert response.get_etag()[0] != etag
+        assert ranged.renders == 1
+
+    def test_changed_sample_misses(self):
+        with self.app.test_request_context('/'):
+            etag = counting_plot(Sensor.query.get(1)).response('png').get_etag()[0]
+
+        # a resent sample replaces the value without a newer datetime
+        sample = Sample.query.filter_by(sensor_id=1).first()
+        sample.value = sample.value + 1
+        db.session.commit()
+        db.session.expire_all()
+        changed = counting_plot(Sensor.query.get(1))
+        with self.app.test_request_context(
+                '/', headers={'If-None-Match': '"{0}"'.format(etag)}):
+            response = changed.response('png')
+        assert response.status_code == 200
+        assert response.get_etag()[0] != etag
+        assert changed.renders == 1
+
+    def test_query_leaves_out_start(self):
+        start = datetime.datetime(2015, 1, 1)
+        for minutes in (0, 15):
+            db.session.add(Sample(sensor_id=1, value=1.0,
+                                  datetime=start + datetime.timedelta(minutes=minutes)))
+        db.session.commit()
+        with self.app.test_request_context('/?start=20150101&end=20150102'):
+            rows = counting_plot(Sensor.query.get(1)).query().all()
+        assert [row.datetime for row in rows] == \
+            [start + datetime.timedelta(minutes=15)]
@@ -1,8 +1,18 @@
+from collections import namedtuple
+import datetime
+import time
+
 import pytest
+import requests
 
 from .test_basics import BasicTestCase
 
-from app.remote import base
+from app.database import db
+from app.models import Sample, Sensor
+from app.remote import base, validators
+
+Response = namedtuple('Response', 'status_code headers content encoding')
+TextResponse = namedtuple('TextResponse', 'text')
 
 
 class TestRemoteBase(BasicTestCase):
@@ -11,3 +21,197 @@ class TestRemoteBase(BasicTestCase):
     def test_get_sample(self):
         with pytest.raises(NotImplementedError):
             self.remote_gage.get_sample(1)
+
+    def test_get_multiple_samples(self):
+        class Remote(base.RemoteGage):
+            @classmethod
+            def fetch(cls, url, **kwargs):
+                if url == 'broken':
+                    raise requests.ConnectionError(url)
+                return Response(200, {}, b'3.5', 'utf-8')
+
+            def url(self, remote_id, remote_parameter=None):
+                return remote_id
+
+            def parse(self, text, remote_id, remote_parameter=None):
+                return datetime.datetime.now(), float(text)
+
+        broken = Sensor(gage_id=1, stype='broken', local=False,
+                        remote_id='broken')
+        db.session.add(broken)
+        db.session.commit()
+        before = Sample.query.count()
+        Remote().get_multiple_samples([1, broken.id])
+        assert Sample.query.count() == before + 1
+        assert Sensor.query.get(1).recent().value == 3.5
+
+    def test_schedule_polls(self):
+        now = datetime.datetime.now()
+        for quarters in range(12, 0, -1):
+            db.session.add(Sample(sensor_id=1, value=1.0,
+                                  datetime=now - datetime.timedelta(minutes=15 * quarters)))
+        db.session.commit()
+        missed = Sensor(gage_id=1, stype='missed', local=False,
+                        remote_id='missed')
+        db.session.add(missed)
+        db.session.commit()
+        assert Sensor.remote_due(now).filter(Sensor.id == missed.id).count() == 1
+
+        fetched = datetime.datetime.now()
+        base.save_fetch_results([
+            base.FetchResult('Remote', 'http://example.com/a',
+                             validators.PROCESSED,
+                             validators.Validator(None, None, 'digest'),
+                             [(1, now, 2.0)], [1]),
+            base.FetchResult('Remote', 'http://example.com/b',
+                             validators.FAILED, None, [], [missed.id])])
+        db.session.expire_all()
+        updated = Sensor.query.get(1)
+        assert updated.poll_interval == 15 * 60
+        assert fetched + datetime.timedelta(minutes=15) <= updated.next_poll <= \
+            datetime.datetime.now() + datetime.timedelta(minutes=15)
+        missed = Sensor.query.get(missed.id)
+        assert missed.poll_misses == 1
+        assert missed.next_poll > now
+        assert Sensor.remote_due(now).filter(Sensor.id == missed.id).count() == 0
+
+    def test_schedule_polls_station_time(self):
+        # a station 9 hours ahead of the server, whose samples are stored in
+        # the station's own time
+        server = datetime.datetime.now(datetime.timezone.utc).astimezone()
+        station = datetime.timezone(server.utcoffset() +
+                                    datetime.timedelta(hours=9))
+        now = server.astimezone(station)
+        for quarters in range(12, 0, -1):
+            dt = now - datetime.timedelta(minutes=15 * quarters)
+            db.session.add(Sample(sensor_id=1, value=1.0,
+                                  datetime=dt.replace(tzinfo=None)))
+        db.session.commit()
+
+        fetched = datetime.datetime.now()
+        base.save_fetch_results([
+            base.FetchResult('Remote', 'http://example.com/a',
+                             validators.PROCESSED,
+                             validators.Validator(None, None, 'digest'),
+                             [(1, now.replace(tzinfo=None), 2.0)], [1])])
+        db.session.expire_all()
+        updated = Sensor.query.get(1)
+        assert updated.poll_interval == 15 * 60
+        assert fetched + datetime.timedelta(minutes=15) <= updated.next_poll <= \
+            datetime.datetime.now() + datetime.timedelta(minutes=15)
+
+    def test_session(self):
+        class Remote(base.RemoteGage):
+            pass
+
+        assert Remote.session() is Remote.session()
+        assert Remote.session() is not base.RemoteGage.session()
+
+    def test_add_new_samples(self):
+        dt = datetime.datetime.now()
+        before = Sample.query.count()
+        kept, discarded = base.add_new_samples([(1, dt, 4.0), (1, dt, 4.0)])
+        assert len(kept) == 1
+        assert [result.reason for result in discarded] == [base.DUPLICATE]
+        assert Sample.query.count() == before + 1
+        assert Sensor.query.get(1).recent().value == 4.0
+        kept, discarded = base.add_new_samples([(1, dt, 4.0)])
+        assert kept == []
+        assert discarded[0].reason == base.TOO_SOON
+
+    def test_add_new_samples_history(self):
+        dt = datetime.datetime.now() - datetime.timedelta(days=2)
+        samples = [(1, dt + datetime.timedelta(minutes=15 * i), float(i))
+                   for i in range(4)]
+        kept, discarded = base.add_new_samples(samples, deltaminutes=0)
+        assert len(kept) == 4
+        # the fixture sample from 12 hours ago is still the latest
+        assert Sensor.query.get(1).recent().value == 5.8
+        kept, discarded = base.add_new_samples(samples, deltaminutes=0)
+        assert kept == []
+        assert len(discarded) == 4
+
+    def test_handle_response(self):
+        class Remote(base.RemoteGage):
+            def parse(self, text, remote_id, remote_parameter=None):
+                return datetime.datetime.now(), float(text)
+
+        remote = Remote()
+        sensors = [(1, 'site', None)]
+        result = remote.handle_response('http://example.com/', sensors, None,
+                                        200, {'ETag': '"abc"'}, b'3.5', None)
+        assert result.outcome == validators.PROCESSED
+        assert result.samples[0][2] == 3.5
+        assert result.validator.etag == '"abc"'
+        unchanged = remote.handle_response('http://example.com/', sensors,
+                                           result.validator, 200, {}, b'3.5',
+                                           None)
+        assert unchanged.outcome == validators.UNCHANGED
+        assert unchanged.samples == []
+        not_modified = remote.handle_response('http://example.com/', sensors,
+                                              result.validator, 304, {}, b'',
+                                              None)
+        assert not_modified.outcome == validators.NOT_MODIFIED
+
+    def test_save_fetch_results(self):
+        validator = validators.Validator('"abc"', None, 'digest')
+        base.save_fetch_results([
+            base.FetchResult('Remote', 'http://example.com/a',
+                             validators.UNCHANGED, validator, [], []),
+            base.FetchResult('Remote', 'http://example.com/b',
+                             validators.FAILED, None, [], [])])
+        assert validators.load_validators(['http://example.com/a',
+                                           'http://example.com/b']) == \
+            {'http://example.com/a': validator}
+        metrics = validators.fetch_metrics(['Remote'])['Remote']
+        assert metrics[validators.UNCHANGED] == 1
+        assert metrics[validators.FAILED] == 1
+        assert metrics[validators.PROCESSED] == 0
+        base.save_fetch_results([
+            base.FetchResult('Remote', 'http://example.com/a',
+                             validators.UNCHANGED, validator, [], [])])
+        metrics = validators.fetch_metrics(['Remote'])['Remote']
+        assert metrics[validators.UNCHANGED] == 2
+
+    def test_save_fetch_results_too_soon(self):
+        now = datetime.datetime.now()
+        kept = validators.Validator('"kept"', None, 'kept')
+        too_soon = validators.Validator('"soon"', None, 'soon')
+        base.save_fetch_results([
+            base.FetchResult('Remote', 'http://example.com/kept',
+                             validators.PROCESSED, kept, [(1, now, 4.0)], [1])])
+        base.save_fetch_results([
+            base.FetchResult('Remote', 'http://example.com/soon',
+                             validators.PROCESSED, too_soon,
+                             [(1, now + datetime.timedelta(minutes=1), 5.0)],
+                             [1])])
+        assert validators.load_validators(['http://example.com/kept',
+                                           'http://example.com/soon']) == \
+            {'http://example.com/kept': kept}
+
+    def test_backfill(self):
+        dt = datetime.datetime(2017, 3, 1, 12, 0)
+
+        class Remote(base.RemoteGage):
+            BACKFILL_INTERVAL = 0
+
+            @classmethod
+            def fetch(cls, url, **kwargs):
+                return TextResponse('4.5')
+
+            def url(self, remote_id, remote_parameter=None):
+                return 'http://example.com/{0}'.format(remote_id)
+
+            def parse(self, text, remote_id, remote_parameter=None):
+                return dt, float(text)
+
+        assert Remote().backfill([1]) == (1, 0)
+        assert Remote().backfill([1]) == (0, 1)
+        assert Sample.query.filter_by(sensor_id=1, datetime=dt).one().value == 4.5
+
+    def test_rate_limiter(self):
+        limiter = base.RateLimiter(0.05)
+        start = time.monotonic()
+        for _ in range(3):
+            limiter.wait()
+        assert time.monotonic() - start >= 0.1
@@ -4,7 +4,7 @@ import vcr
 
 from .test_basics import BasicTestCase
 
-from app.remote import cawateroffice
+from app.remote import base, cawateroffice
 from app.models import Sensor, Sample
 
 my_vcr = vcr.VCR(
@@ -46,3 +46,79 @@ class TestWaterOffice(BasicTestCase):
         self.WO.get_multiple_samples(sensor_ids)
         after = Sample.query.count()
         assert after > before
+
+    def test_latest_tail(self):
+        # a Range response starts part way through a row
+        lines = ['-01T00:55:00-08:00,1.5,1,-1,,',
+                 'BC_07EA004,2017-03-01T01:00:00-08:00,1.52,1,-1,,12.5,1,-1,,',
+                 'BC_07EA004,2017-03-01T01:05:00-08:00,1.53,1,-1,,,,,,']
+        dt, level, discharge = self.WO.latest(lines)
+        assert (dt.hour, dt.minute) == (1, 5)
+        assert level == 1.53
+        assert discharge is None
+        assert self.WO.HEADERS['Range'] == 'bytes=-{0}'.format(
+            self.WO.TAIL_BYTES)
+
+    def test_station_batching(self):
+        sensors = [(1, 'BC_07EA004', None), (2, 'BC_07EA004', 'discharge'),
+                   (3, 'AB_05CA004', None)]
+        fetches = self.WO.requests_for(sensors)
+        assert len(fetches) == 2
+        assert fetches[0][1] == sensors[:2]
+
+        text = ('ID,Date,Water Level / Niveau d\'eau (m),...\n'
+                'BC_07EA004,2017-03-01T01:05:00-08:00,1.53,1,-1,,12.5,1,-1,,')
+        samples = self.WO.parse_samples(text, fetches[0][1])
+        assert [(s[0], s[2]) for s in samples] == [(1, 1.53), (2, 12.5)]
+
+    def test_range_ignored(self):
+        # a server that ignores the Range sends the whole file with a 200
+        rows = ['BC_07EA004,2017-03-01T{0:02d}:{1:02d}:00-08:00,{2:.2f},1,-1,,'
+                '12.5,1,-1,,'.format(n // 60, n % 60, 1 + n / 1000.0)
+                for n in range(0, 24 * 60, 1)]
+        body = ('ID,Date,Water Level / Niveau d\'eau (m),...\n' +
+                '\n'.join(rows)).encode('utf-8')
+        assert len(body) > 2 * self.WO.TAIL_BYTES
+
+        class FullResponse(object):
+            status_code = 200
+            headers = {}
+            encoding = 'utf-8'
+            chunks = 0
+
+            @property
+            def content(self):
+                raise AssertionError('whole body read')
+
+            def iter_content(self, chunk_size):
+                for start in range(0, len(body), chunk_size):
+                    FullResponse.chunks += 1
+                    yield body[start:start + chunk_size]
+
+            def close(self):
+                pass
+
+        class WaterOffice(cawateroffice.WaterOffice):
+            @classmethod
+            def fetch(cls, url, **kwargs):
+                assert kwargs['stream']
+                return FullResponse()
+
+        sensors = [(1, 'BC_07EA004', None), (2, 'BC_07EA004', 'discharge')]
+        url = self.WO.url('BC_07EA004')
+        result = WaterOffice()._fetch_samples((url, sensors, None))
+        assert FullResponse.chunks > 1
+        assert [(s[0], s[1].hour, s[1].minute, s[2])
+                for s in result.samples] == [(1, 23, 59, 2.44),
+                                             (2, 23, 59, 12.5)]
+        assert base.read_tail([body[:10], body[10:]], 20) == body[-20:]
+
+    def test_rows_since_utc(self):
+        # the last sample was at 06:00 UTC, which is 01:00 at a UTC-5 station
+        since = datetime.datetime(2017, 3, 1, 6, 0)
+        lines = ['ID,Date,Water Level / Niveau d\'eau (m),...',
+                 'ON_02KB001,2017-03-01T01:00:00-05:00,1.50,1,-1,,,,,,',
+                 'ON_02KB001,2017-03-01T01:05:00-05:00,1.51,1,-1,,,,,,',
+                 'ON_02KB001,2017-03-01T05:55:00-05:00,1.52,1,-1,,,,,,']
+        rows = list(self.WO.rows_since(lines, since))
+        assert [level for dt, level, discharge in rows] == [1.51, 1.52]
@@ -32,3 +32,17 @@ class TestCEHQ(BasicTestCase):
         self.CEHQ.get_sample(sensor.id)
         after = Sample.query.count()
         assert after > before
+
+    def test_station_batching(self):
+        sensors = [(1, self.SITE_NUM, None), (2, self.SITE_NUM, 'flow'),
+                   (3, '030101', None)]
+        fetches = self.CEHQ.requests_for(sensors)
+        assert len(fetches) == 2
+        assert fetches[0][1] == sensors[:2]
+
+        text = ('Station: 050915\n'
+                'Date\tHeure\tDebit (m3/s)\n'
+                '2017-03-01\t01:00\t12,5 *\n')
+        samples = self.CEHQ.parse_samples(text, fetches[0][1])
+        assert [(s[0], s[2]) for s in samples] == [(1, 12.5), (2, 12.5)]
+        assert samples[0][1] == samples[1][1]
@@ -1,10 +1,12 @@
 import datetime
+from unittest import mock
 
+from bs4 import BeautifulSoup
 import vcr
 
 from .test_basics import BasicTestCase
 
-from app.remote import corps
+from app.remote import base, corps
 from app.models import Sensor, Sample
 
 my_vcr = vcr.VCR(
@@ -30,3 +32,21 @@ class TestCorps(BasicTestCase):
         self.corps.get_sample(sensor.id)
         after = Sample.query.count()
         assert after > before
+
+    @my_vcr.use_cassette('tests/fixtures/corps_soup_dt_value')
+    def test_parsers_agree(self):
+        parsers = ['html.parser']
+        if base.HTML_PARSER == 'lxml':
+            parsers.append('lxml')
+        for site_num in self.SITES:
+            text = self.corps.fetch(self.corps.url(site_num)).text
+            sensors = [(1, site_num, None), (2, site_num, None)]
+            results = []
+            for parser in parsers:
+                with mock.patch.object(base, 'HTML_PARSER', parser):
+                    samples = self.corps.parse_samples(text, sensors)
+                whole = self.corps.dt_value(site_num,
+                                            soup=BeautifulSoup(text, parser))
+                assert [sample[1:] for sample in samples] == [whole, whole]
+                results.append(whole)
+            assert results.count(results[0]) == len(results)
@@ -41,3 +41,11 @@ class TestH2Oline(BasicTestCase):
         dt, value = self.h2oline.dt_value(self.SITE_NUM, soup=soup)
         assert type(dt) == datetime.datetime
         assert type(value) == float
+
+    def test_parse_samples(self):
+        text = ('<html><body><p>235127 RAPID RIVER</p>'
+                '<p>the total flow below the dam was 800 CFS</p>'
+                '<p>the lake level is 1449.75 FT</p></body></html>')
+        sensors = [(1, '235127', None), (2, '235127', 'FT')]
+        samples = self.h2oline.parse_samples(text, sensors)
+        assert [(s[0], s[2]) for s in samples] == [(1, 800.0), (2, 1449.75)]
@@ -1,3 +1,6 @@
+import datetime
+import json
+
 import vcr
 
 from .test_basics import BasicTestCase
@@ -30,3 +33,41 @@ class TestUSGS(BasicTestCase):
         self.U.get_multiple_samples(sensor_ids)
         after = Sample.query.count()
         assert after > before
+
+    def test_requests_for(self):
+        sensors = [(1, '01054200', None), (2, '01055000', '00060'),
+                   (3, '01057000', None)]
+        fetches = self.U.requests_for(sensors)
+        assert len(fetches) == 2
+        assert fetches[0][0].endswith('&sites=01054200,01057000&parameterCD=00065')
+        assert fetches[0][1] == [sensors[0], sensors[2]]
+
+    def test_history_requests(self):
+        now = datetime.datetime.now()
+        sensors = [(1, '01054200', None, now - datetime.timedelta(days=2)),
+                   (2, '01057000', None, now - datetime.timedelta(hours=3))]
+        fetches = self.U.history_requests(sensors)
+        assert len(fetches) == 1
+        assert fetches[0][0].endswith(
+            '&sites=01054200,01057000&parameterCD=00065&period=PT50H')
+        assert fetches[0][1] == sensors
+
+    def test_parse_samples_skips_empty_sites(self):
+        def series(code, values):
+            return {'name': 'USGS:{0}:00065:00000'.format(code),
+                    'sourceInfo': {'siteCode': [{'value': code}]},
+                    'variable': {'noDataValue': -999999.0},
+                    'values': [{'value': values}]}
+
+        text = json.dumps({'value': {'timeSeries': [
+            series('01054200', [{'dateTime': '2017-03-01T12:00:00.000-05:00',
+                                 'value': '3.52'}]),
+            series('01055000', []),
+            series('01057000', [{'dateTime': '2017-03-01T12:00:00.000-05:00',
+                                 'value': '-999999'}]),
+            series('01064500', [{'dateTime': '2017-03-01T12:00:00.000-05:00',
+                                 'value': 'Ice'}])]}})
+        sensors = [(1, '01054200', None), (2, '01055000', None),
+                   (3, '01057000', None), (4, '01064500', None)]
+        samples = self.U.parse_samples(text, sensors)
+        assert [(sample[0], sample[2]) for sample in samples] == [(1, 3.52)]
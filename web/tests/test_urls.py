@@ -0,0 +1,34 @@
+import unittest
+
+import pytest
+
+from flask import Flask, url_for
+
+from app.urls import external_url
+
+
+class ExternalURLTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+
+        @self.app.route('/gages/<int:gid>')
+        def gage(gid):
+            pass
+
+        @self.app.route('/<river>/<slug>/')
+        def section(river, slug):
+            pass
+
+    def test_matches_url_for(self):
+        with self.app.test_request_context(base_url='http://riverflo.ws/'):
+            for gid in (1, 12, 918273645):
+                assert external_url('gage', gid=gid) == \
+                    url_for('gage', gid=gid, _external=True)
+            values = {'river': 'wild{river}', 'slug': 'gilead to shelburne'}
+            assert external_url('section', **values) == \
+                url_for('section', _external=True, **values)
+
+    def test_none_raises(self):
+        with self.app.test_request_context(base_url='http://riverflo.ws/'):
+            with pytest.raises(ValueError):
+                external_url('gage', gid=None)